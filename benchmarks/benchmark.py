@@ -0,0 +1,300 @@
+"""
+Benchmarks of the simbook simulators and tree sequence
+traversals, with msprime and tskit as the reference.
+
+Each case is run over a grid of sample sizes, numbers
+of demes, and numbers of replicates.  The wall time (the
+fastest of several runs), the number of events per second,
+and the growth in peak resident memory while the case
+runs are written to a JSON file.  Memory is measured in
+an extra, untimed run in a forked child process, as the
+rise in ``resource.getrusage(...).ru_maxrss`` from the
+child's start, so that arrays allocated by NumPy, Numba,
+msprime and tskit are counted along with Python objects.
+
+For the simulators, an event is a coalescence or a
+migration.  The migrations are counted by the simulators'
+profiling statistics and, for msprime, by recording
+migrations.  For the traversals, an event is an edge
+insertion or removal.
+
+If a baseline results file is given, any case that is
+slower than the baseline by more than the tolerance is
+reported as a regression, and the exit status is 1.
+The stored baseline is ``benchmarks/baseline.json``, from
+a full run with the Numba backend.  Wall times depend on
+the machine, so before comparing on a new machine, write
+a baseline there from a clean checkout:
+
+    PYTHONPATH=. python3 benchmarks/benchmark.py \
+        --output benchmarks/baseline.json
+
+and then check a change against it:
+
+    PYTHONPATH=. python3 benchmarks/benchmark.py \
+        --baseline benchmarks/baseline.json
+
+Peak resident memory is read from :mod:`resource` and
+forked processes are used, so the benchmarks run on
+Linux and macOS only.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+import msprime
+import numpy as np
+
+import simbook.coalescent.demes as demes
+import simbook.coalescent.hudson1990 as hudson1990
+import simbook.coalescent.migration as migration
+from simbook.coalescent.backend import BACKEND
+from simbook.treeseqs.algT import algT
+from simbook.treeseqs.statistics import TotalTime, custom_quantities
+
+SAMPLE_SIZES = [10, 100, 1000]
+DEME_COUNTS = [2, 8, 32]
+REPLICATES = [10, 100]
+MIGRATE = 1.0
+SEED = 42
+
+
+def _island_model(ndemes):
+    migmat = np.full((ndemes, ndemes), MIGRATE/(ndemes - 1))
+    np.fill_diagonal(migmat, 0.)
+    return migmat
+
+
+def _hudson(nsam, nreps, rng):
+    for i in range(nreps):
+        hudson1990.simulate(nsam, rng=rng)
+    return nreps*(nsam - 1)
+
+
+def _msprime(nsam, nreps, rng):
+    seed = int(rng.integers(1, 2**31))
+    for ts in msprime.simulate(nsam, num_replicates=nreps,
+                               random_seed=seed):
+        pass
+    return nreps*(nsam - 1)
+
+
+def _two_demes(nsam, nreps, rng):
+    events = 0
+    for i in range(nreps):
+        ts, stats = migration.simulate_two_demes(nsam//2, nsam - nsam//2,
+                                                 MIGRATE, rng=rng,
+                                                 profile=True)
+        events += sum(stats.events.values())
+    return events
+
+
+def _demes(nsam, ndemes, nreps, rng):
+    sizes = [nsam//ndemes]*ndemes
+    sizes[0] += nsam - sum(sizes)
+    migmat = _island_model(ndemes)
+    events = 0
+    for i in range(nreps):
+        ts, stats = demes.simulate_demes(sizes, migmat, rng=rng,
+                                         profile=True)
+        events += sum(stats.events.values())
+    return events
+
+
+def _msprime_demes(nsam, ndemes, nreps, rng):
+    sizes = [nsam//ndemes]*ndemes
+    sizes[0] += nsam - sum(sizes)
+    config = [msprime.PopulationConfiguration(sample_size=i)
+              for i in sizes]
+    # Legacy msprime.simulate rates are per generation.
+    # With Ne = 1, one of our time units of 2N generations
+    # is two of its generations, so the rates are halved.
+    migmat = (_island_model(ndemes)/2.).tolist()
+    seed = int(rng.integers(1, 2**31))
+    events = 0
+    for ts in msprime.simulate(population_configurations=config,
+                               migration_matrix=migmat,
+                               num_replicates=nreps,
+                               record_migrations=True,
+                               random_seed=seed):
+        # Without recombination, each migration
+        # moves one lineage and leaves one record.
+        events += nsam - 1 + ts.num_migrations
+    return events
+
+
+def _recombining_ts(nsam, rng):
+    seed = int(rng.integers(1, 2**31))
+    return msprime.simulate(nsam, recombination_rate=nsam,
+                            random_seed=seed)
+
+
+def _algT(ts):
+    for left, right, parent in algT(ts):
+        pass
+    return 2*ts.num_edges
+
+
+def _custom_quantities(ts):
+    for left, right, result in custom_quantities(ts, [TotalTime()]):
+        pass
+    return 2*ts.num_edges
+
+
+def _tskit_trees(ts):
+    for tree in ts.trees():
+        tree.total_branch_length
+    return 2*ts.num_edges
+
+
+def _peak_memory(func, args, queue):
+    # ru_maxrss is in kilobytes on Linux and in bytes
+    # on macOS.  A forked child starts from its own
+    # resident pages, not from the parent's peak.
+    scale = 1 if sys.platform == "darwin" else 1024
+    start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func(*args)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((peak - start)*scale)
+
+
+def _measure(func, args, repeats):
+    # The fastest of several runs is the
+    # least affected by other processes.
+    wall_time = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        events = func(*args)
+        wall_time = min(wall_time, time.perf_counter() - start)
+    # The peak resident size of this process never
+    # falls, so each case is run again in a child.
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    child = context.Process(target=_peak_memory, args=(func, args, queue))
+    child.start()
+    peak = queue.get()
+    child.join()
+    return {"wall_time": wall_time,
+            "events": events,
+            "events_per_second": events/wall_time,
+            "peak_memory": peak}
+
+
+def _cases(sample_sizes, deme_counts, replicates, rng):
+    for nsam in sample_sizes:
+        for nreps in replicates:
+            params = {"nsam": nsam, "replicates": nreps}
+            yield ("hudson1990.simulate", params,
+                   _hudson, (nsam, nreps, rng))
+            yield ("msprime.simulate", params,
+                   _msprime, (nsam, nreps, rng))
+            yield ("migration.simulate_two_demes", params,
+                   _two_demes, (nsam, nreps, rng))
+            for ndemes in deme_counts:
+                if ndemes > nsam:
+                    continue
+                params = {"nsam": nsam, "demes": ndemes,
+                          "replicates": nreps}
+                yield ("demes.simulate_demes", params,
+                       _demes, (nsam, ndemes, nreps, rng))
+                yield ("msprime.simulate[demes]", params,
+                       _msprime_demes, (nsam, ndemes, nreps, rng))
+
+
+def _traversal_cases(sample_sizes, rng):
+    for nsam in sample_sizes:
+        ts = _recombining_ts(nsam, rng)
+        params = {"nsam": nsam, "edges": ts.num_edges,
+                  "trees": ts.num_trees}
+        yield "treeseqs.algT", params, _algT, (ts,)
+        yield ("treeseqs.custom_quantities", params,
+               _custom_quantities, (ts,))
+        yield "tskit.trees", params, _tskit_trees, (ts,)
+
+
+def _key(result):
+    return json.dumps([result["name"], result["params"]], sort_keys=True)
+
+
+def run(sample_sizes=SAMPLE_SIZES, deme_counts=DEME_COUNTS,
+        replicates=REPLICATES, seed=SEED, repeats=3):
+    """
+    Run all benchmarks and return a list of results.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    cases = list(_cases(sample_sizes, deme_counts, replicates, rng))
+    cases.extend(_traversal_cases(sample_sizes, rng))
+    for name, params, func, args in cases:
+        result = {"name": name, "params": params}
+        result.update(_measure(func, args, repeats))
+        print("{} {}: {:.4f} s, {:.0f} events/s, {} bytes".format(
+            name, params, result["wall_time"],
+            result["events_per_second"], result["peak_memory"]),
+            file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Return the results whose wall time exceeds
+    that of the matching baseline result by more
+    than the given fraction.
+    """
+    previous = {_key(r): r for r in baseline}
+    slower = []
+    for r in results:
+        b = previous.get(_key(r))
+        if b is None:
+            continue
+        if r["wall_time"] > b["wall_time"]*(1. + tolerance):
+            slower.append((r, b))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="bench_output.json",
+                        help="Where to write the results")
+    parser.add_argument("--baseline",
+                        help="Results of a previous run to compare to, "
+                             "such as benchmarks/baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed fractional slow down "
+                             "relative to the baseline")
+    parser.add_argument("--quick", action="store_true",
+                        help="Only run the smallest grid")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Number of timed runs of each case")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    if args.quick:
+        results = run([10, 100], [2, 8], [10], seed=args.seed,
+                      repeats=args.repeats)
+    else:
+        results = run(seed=args.seed, repeats=args.repeats)
+
+    with open(args.output, "w") as f:
+        json.dump({"numpy": np.__version__,
+                   "backend": BACKEND,
+                   "msprime": msprime.__version__,
+                   "results": results}, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        slower = regressions(results, baseline, args.tolerance)
+        for r, b in slower:
+            print("REGRESSION {} {}: {:.4f} s (baseline {:.4f} s)".format(
+                r["name"], r["params"], r["wall_time"], b["wall_time"]))
+        if len(slower) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import tskit
 import numpy as np
 import scipy.stats
 import simbook.coalescent.migration as migration
+from simbook.cache import cached
 from matplotlib import rc
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -13,29 +14,34 @@ n1 = 5
 samples = [[i for i in range(n0)], [i for i in range(n0, n0+n1)]]
 migrate = 0.5
 
-np.random.seed(35891235)
-tmrca_simbook = np.zeros(nreps)
-f2_simbook = np.zeros(nreps)
+tmrca_simbook, ttot_simbook, f2_simbook = cached(
+    migration.simulate_two_demes_summaries, 35891235,
+    ["tmrca", "ttot", "f2"], n0=n0, n1=n1, migrate=migrate,
+    num_replicates=nreps)
 
-for i in range(nreps):
-    ts = migration.simulate_two_demes(n0, n1, migrate)
-    tmrca_simbook[i] = ts.tables.nodes.time.max()
-    f2 = ts.f2(samples, mode='branch')
-    f2_simbook[i] = f2
 
-tmrca_msprime = np.zeros(nreps)
-f2_msprime = np.zeros(nreps)
+def msprime_tmrca_and_f2(n0, n1, migrate, nreps, rng):
+    tmrca = np.zeros(nreps)
+    f2 = np.zeros(nreps)
 
-config = [msprime.PopulationConfiguration(sample_size=n0),
-          msprime.PopulationConfiguration(sample_size=n1)]
-migmat = [[0, migrate/2.], [migrate/2., 0]]
+    config = [msprime.PopulationConfiguration(sample_size=n0),
+              msprime.PopulationConfiguration(sample_size=n1)]
+    migmat = [[0, migrate/2.], [migrate/2., 0]]
+    seed = rng.integers(1, np.iinfo(np.uint32).max)
 
-for i, ts in enumerate(msprime.simulate(Ne=1, population_configurations=config,
-                                        migration_matrix=migmat,
-                                        num_replicates=nreps,
-                                        random_seed=123235253)):
-    tmrca_msprime[i] = 0.5*ts.tables.nodes.time.max()
-    f2_msprime[i] = 0.5*ts.f2(samples,mode='branch')
+    for i, ts in enumerate(msprime.simulate(Ne=1,
+                                            population_configurations=config,
+                                            migration_matrix=migmat,
+                                            num_replicates=nreps,
+                                            random_seed=seed)):
+        tmrca[i] = 0.5*ts.tables.nodes.time.max()
+        f2[i] = 0.5*ts.f2(samples, mode='branch')
+    return tmrca, f2
+
+
+tmrca_msprime, f2_msprime = cached(msprime_tmrca_and_f2, 123235253,
+                                   ["tmrca", "f2"], n0=n0, n1=n1,
+                                   migrate=migrate, nreps=nreps)
 
 fig = plt.figure()
 gs = gridspec.GridSpec(1, 2)
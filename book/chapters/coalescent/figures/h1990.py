@@ -1,5 +1,6 @@
 import numpy as np
 import simbook.coalescent.hudson1990 as hudson1990
+from simbook.cache import cached
 from matplotlib import rc
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -7,13 +8,19 @@ rc('font', **{'size': 18})
 
 nreps = 10000
 nsam = 50
-tmrca = np.zeros(nreps)
-ttot = np.zeros(nreps)
-for i in range(nreps):
-    ts = hudson1990.simulate(nsam)
-    tree = ts.first()
-    ttot[i] = tree.total_branch_length
-    tmrca[i] = ts.tables.nodes.time.max()
+
+
+def tmrca_and_ttot(nsam, nreps, rng):
+    time, parent, child = hudson1990.simulate_replicates(nsam, nreps,
+                                                         rng=rng)
+    tmrca = time.max(axis=1)
+    ttot = (time[:, parent] -
+            np.take_along_axis(time, child, axis=1)).sum(axis=1)
+    return tmrca, ttot
+
+
+tmrca, ttot = cached(tmrca_and_ttot, 1234, ["tmrca", "ttot"],
+                     nsam=nsam, nreps=nreps)
 
 fig = plt.figure()
 gs = gridspec.GridSpec(1, 2)
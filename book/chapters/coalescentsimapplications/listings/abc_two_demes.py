@@ -0,0 +1,14 @@
+import numpy as np
+from simbook import abc
+
+# Totals of TMRCA and TTOT over 50 loci, for
+# five samples from each of two demes
+observed = np.array([170., 560.])
+params, stats, distances, counts = abc.rejection(
+    abc.two_demes_totals, {"migrate": abc.LogUniform(0.01, 10.)},
+    observed, threshold=60., num_draws=10**5, seed=42,
+    output="abc_two_demes.tsv",
+    kwargs=dict(n0=5, n1=5, num_loci=50),
+    lower_bound=abc.running_total_bound)
+print(counts)
+print(np.quantile(params[:, 0], [0.025, 0.5, 0.975]))
@@ -0,0 +1,13 @@
+import numpy as np
+import simbook.coalescent.hudson1990 as hudson1990
+from simbook import training
+
+data = training.generate("training_data", hudson1990.simulate,
+                         num_replicates=10**5, seed=101, theta=10.,
+                         kwargs=dict(nsam=20), max_sites=128)
+rng = np.random.default_rng(202)
+for batch in data.minibatches(256, rng):
+    # Each value is a view of a memory-mapped file,
+    # with the replicates along the first axis
+    x = batch["genotypes"]
+    y = batch["coalescence_times"]
@@ -0,0 +1,13 @@
+import numpy as np
+from simbook.forward import wright_fisher
+
+# 10,000 diploids for 10N generations, simplifying
+# every 100 generations
+N = 10000
+ts, stats = wright_fisher.simulate(N, 10*N, rng=np.random.default_rng(42),
+                                   recombination_rate=1.,
+                                   simplify_interval=100, profile=True)
+print(stats)
+print("generations per second:", stats.per_second("generations"))
+print("generations per second times N:", stats.per_second("individuals"))
+print(ts.num_trees, ts.num_nodes, ts.num_edges)
@@ -1,22 +1,26 @@
 import msprime
 import numpy as np
 import matplotlib.pyplot as plt
+from simbook.cache import cached
 
 nreps = 10000
 
-nmuts1 = np.zeros(nreps)
-nmuts2 = np.zeros(nreps)
 
-for i, ts in enumerate(msprime.simulate(10, mutation_rate=25.0,
-                                        num_replicates=nreps,
-                                        random_seed=3152512)):
-    nmuts1[i] = ts.num_mutations
+def num_mutations(mutation_rate, Ne, nreps, rng):
+    nmuts = np.zeros(nreps)
+    seed = rng.integers(1, np.iinfo(np.uint32).max)
+    for i, ts in enumerate(msprime.simulate(10, mutation_rate=mutation_rate,
+                                            Ne=Ne,
+                                            num_replicates=nreps,
+                                            random_seed=seed)):
+        nmuts[i] = ts.num_mutations
+    return nmuts,
 
-for i, ts in enumerate(msprime.simulate(10, mutation_rate=0.25,
-                                        Ne=100,
-                                        num_replicates=nreps,
-                                        random_seed=3152512)):
-    nmuts2[i] = ts.num_mutations
+
+nmuts1, = cached(num_mutations, 3152512, ["nmuts"],
+                 mutation_rate=25.0, Ne=1, nreps=nreps)
+nmuts2, = cached(num_mutations, 3152512, ["nmuts"],
+                 mutation_rate=0.25, Ne=100, nreps=nreps)
 
 fig = plt.figure()
 n, b, p = plt.hist(nmuts1, 100, density=True,
@@ -1,49 +1,42 @@
 import msprime
 import numpy as np
 import matplotlib.pyplot as plt
+from simbook.sfs import allele_frequency_spectra, singleton_proportion
+from simbook.cache import cached
 
 nreps = 250
 n, m1, m2, sem1, sem2 = [], [], [], [], []
 
-np.random.seed(5125125)
 
-for nsam in range(5, 135, 20):
+def split_sfs(nsam, ancestral_size, nreps, rng):
     config = [msprime.PopulationConfiguration(sample_size=nsam),
               msprime.PopulationConfiguration(sample_size=nsam)]
 
     events = [msprime.MassMigration(time=0.025, source=1,
                                     dest=0, proportion=1.0)]
+    if ancestral_size != 1:
+        events.append(msprime.PopulationParametersChange(
+            time=0.025, initial_size=ancestral_size))
+
+    seed = rng.integers(1, np.iinfo(np.uint32).max)
+
+    sfs = allele_frequency_spectra(
+        msprime.simulate(population_configurations=config,
+                         demographic_events=events,
+                         mutation_rate=50,
+                         random_seed=seed,
+                         num_replicates=nreps), 2*nsam, nreps)
+    return sfs,
+
+
+for nsam in range(5, 135, 20):
+    sfs, = cached(split_sfs, [5125125, nsam], ["sfs"],
+                  nsam=nsam, ancestral_size=1, nreps=nreps)
+    nsing = singleton_proportion(sfs)
 
-    nsing = np.zeros(nreps)
-    seed = np.random.randint(0, np.iinfo(np.uint32).max, 1)
-
-    for i, ts in enumerate(msprime.simulate(population_configurations=config,
-                                            demographic_events=events,
-                                            mutation_rate=50,
-                                            random_seed=seed,
-                                            num_replicates=nreps)):
-        s = 0
-        for v in ts.variants():
-            if v.genotypes.sum() == 1:
-                s += 1
-        nsing[i] = s/ts.num_mutations
-
-    events.append(msprime.PopulationParametersChange(time=0.025,
-                                                     initial_size=2))
-
-    nsing2 = np.zeros(nreps)
-    seed = np.random.randint(0, np.iinfo(np.uint32).max, 1)
-
-    for i, ts in enumerate(msprime.simulate(population_configurations=config,
-                                            demographic_events=events,
-                                            mutation_rate=50,
-                                            random_seed=seed,
-                                            num_replicates=nreps)):
-        s = 0
-        for v in ts.variants():
-            if v.genotypes.sum() == 1:
-                s += 1
-        nsing2[i] = s/ts.num_mutations
+    sfs, = cached(split_sfs, [5125125, nsam], ["sfs"],
+                  nsam=nsam, ancestral_size=2, nreps=nreps)
+    nsing2 = singleton_proportion(sfs)
     n.append(nsam)
     m1.append(nsing.mean())
     m2.append(nsing2.mean())
@@ -0,0 +1,284 @@
+"""
+Approximate Bayesian computation (ABC) by rejection.
+
+Parameters are drawn from their priors, data are simulated,
+and the parameters are accepted when the distance between
+the simulated and observed summary statistics is at most a
+threshold.  The accepted parameters are a sample from an
+approximation to the posterior.
+"""
+import heapq
+import inspect
+import multiprocessing
+
+import numpy as np
+
+from simbook.coalescent.migration import simulate_two_demes_summaries
+from simbook.parallel import chunks
+
+
+class Uniform(object):
+    """
+    A uniform prior on ``[low, high)``.
+    """
+
+    def __init__(self, low, high):
+        if not low < high:
+            raise ValueError("low must be < high")
+        self.low = float(low)
+        self.high = float(high)
+
+    def draw(self, rng, size):
+        return rng.uniform(self.low, self.high, size)
+
+
+class LogUniform(object):
+    """
+    A prior whose logarithm is uniform,
+    for positive parameters such as rates.
+    """
+
+    def __init__(self, low, high):
+        if not 0 < low < high:
+            raise ValueError("must have 0 < low < high")
+        self.low = float(low)
+        self.high = float(high)
+
+    def draw(self, rng, size):
+        return np.exp(rng.uniform(np.log(self.low), np.log(self.high),
+                                  size))
+
+
+def euclidean(stats, observed):
+    """
+    The Euclidean distance between two vectors of statistics.
+    """
+    return float(np.sqrt(((stats - observed)**2).sum()))
+
+
+def running_total_bound(partial, observed):
+    """
+    A lower bound on the Euclidean distance between final
+    and observed statistics, given partial statistics that
+    are running totals of non-negative quantities.
+
+    Totals can only grow, so only those that are already
+    larger than the observed values count towards the
+    bound.
+    """
+    excess = np.maximum(np.asarray(partial) - observed, 0.)
+    return float(np.sqrt((excess**2).sum()))
+
+
+def two_demes_totals(n0, n1, migrate, num_loci, rng, block_size=10):
+    """
+    Simulate independent loci under
+    :func:`simbook.coalescent.migration.simulate_two_demes`
+    and yield the running totals of TMRCA and TTOT over
+    loci after each block of ``block_size`` loci.
+
+    This is a simulator for :func:`rejection` that supports
+    stopping early with :func:`running_total_bound`.
+
+    :param n0: The sample size in deme 0
+    :type n0: int
+    :param n1: The sample size in deme 1
+    :type n1: int
+    :param migrate: The per-lineage migration rate
+    :type migrate: float
+    :param num_loci: The number of independent loci
+    :type num_loci: int
+    :param rng: The source of random numbers
+    :type rng: numpy.random.Generator
+    :param block_size: The number of loci between yields
+    :type block_size: int
+    """
+    totals = np.zeros(2)
+    for start in range(0, num_loci, block_size):
+        n = min(block_size, num_loci - start)
+        tmrca, ttot, f2 = simulate_two_demes_summaries(n0, n1, migrate,
+                                                       n, rng=rng)
+        totals[0] += tmrca.sum()
+        totals[1] += ttot.sum()
+        yield totals.copy()
+
+
+def _final_statistics(stats, observed, threshold, lower_bound):
+    """
+    Return the final statistics of a simulation, or ``None``
+    if its partial statistics show that it will be rejected.
+    """
+    if not inspect.isgenerator(stats):
+        return stats
+    final = None
+    for partial in stats:
+        if lower_bound is not None and \
+                lower_bound(partial, observed) > threshold:
+            stats.close()
+            return None
+        final = partial
+    if final is None:
+        raise ValueError("the simulator yielded no statistics")
+    return final
+
+
+def _run_chunk(task):
+    """
+    Draw parameters and run simulations for one chunk
+    in a worker.  Only accepted draws are sent back.
+    """
+    (simulator, kwargs, names, priors, observed, threshold,
+     distance, lower_bound, num_draws, seed) = task
+    rng = np.random.default_rng(seed)
+    values = np.column_stack([p.draw(rng, num_draws) for p in priors])
+    accepted = []
+    stopped = 0
+    for row in values:
+        params = dict(zip(names, row.tolist()))
+        params.update(kwargs)
+        stats = _final_statistics(simulator(rng=rng, **params),
+                                  observed, threshold, lower_bound)
+        if stats is None:
+            stopped += 1
+            continue
+        stats = np.asarray(stats, dtype=np.float64)
+        d = distance(stats, observed)
+        if d <= threshold:
+            accepted.append((row, stats, d))
+    return accepted, stopped
+
+
+def _tasks(simulator, kwargs, names, priors, observed, threshold,
+           distance, lower_bound, num_draws, seed, chunk_size):
+    for n, s in chunks(num_draws, seed, chunk_size):
+        yield (simulator, kwargs, names, priors, observed, threshold,
+               distance, lower_bound, n, s)
+
+
+def rejection(simulator, priors, observed, threshold, num_draws, seed,
+              output, kwargs=None, distance=euclidean, lower_bound=None,
+              top_k=1000, num_workers=None, chunk_size=1000):
+    """
+    Run ABC by rejection in a pool of processes.
+
+    The draws are split into chunks, and each chunk is run
+    in a worker with its own random number generator, spawned
+    from ``seed`` by :func:`simbook.parallel.chunks`.
+    A worker draws the parameters of its chunk from the
+    priors, runs the simulator as
+    ``simulator(rng=rng, **params, **kwargs)``, computes the
+    distance to the observed statistics, and sends back only
+    the accepted draws.
+
+    Each accepted draw is written to ``output`` as soon as its
+    chunk is done, as a tab-separated row of the parameters,
+    the statistics, and the distance, so nothing is lost if a
+    long run is interrupted.  Only the ``top_k`` draws with
+    the smallest distances are kept in memory.
+
+    The simulator may return the statistics, or it may be a
+    generator that yields statistics after each stage of the
+    simulation, the last of which are the final statistics.
+    If ``lower_bound`` is given, it is called on each partial
+    result, and the simulation is abandoned as soon as it
+    returns more than the threshold.  It must never exceed
+    the distance of the final statistics, for example
+    :func:`running_total_bound` for running totals with the
+    Euclidean distance.
+
+    The results depend only on ``seed`` and ``chunk_size``,
+    not on the number of workers.  All functions and priors
+    must be picklable.
+
+    :param simulator: The simulation function
+    :type simulator: callable
+    :param priors: The prior of each parameter, by name.
+                   A prior has a ``draw(rng, size)`` method,
+                   like :class:`Uniform`.
+    :type priors: dict
+    :param observed: The observed summary statistics
+    :type observed: numpy.ndarray
+    :param threshold: The largest accepted distance
+    :type threshold: float
+    :param num_draws: The number of draws from the priors
+    :type num_draws: int
+    :param seed: The random number seed
+    :type seed: int
+    :param output: The file to write accepted draws to
+    :type output: str
+    :param kwargs: Fixed keyword arguments to the simulator
+    :type kwargs: dict
+    :param distance: The distance between simulated
+                     and observed statistics
+    :type distance: callable
+    :param lower_bound: A lower bound on the final distance,
+                        given partial statistics
+    :type lower_bound: callable
+    :param top_k: The number of best draws to return
+    :type top_k: int
+    :param num_workers: The number of processes.  If ``None``,
+                        the number of CPUs is used.  If 1, the
+                        simulations run in the calling process.
+    :type num_workers: int
+    :param chunk_size: The number of draws per chunk
+    :type chunk_size: int
+
+    :returns: The parameters, statistics, and distances of the
+              best accepted draws, sorted by distance, and a
+              dictionary with the number of draws, the number
+              accepted, and the number stopped early.
+    :rtype: tuple
+    """
+    if num_draws < 0:
+        raise ValueError("number of draws must be >= 0")
+    if chunk_size < 1:
+        raise ValueError("chunk size must be > 0")
+    if top_k < 0:
+        raise ValueError("top_k must be >= 0")
+    if num_workers is not None and num_workers < 1:
+        raise ValueError("number of workers must be > 0")
+    if kwargs is None:
+        kwargs = {}
+    names = list(priors)
+    observed = np.asarray(observed, dtype=np.float64)
+
+    tasks = _tasks(simulator, kwargs, names, [priors[i] for i in names],
+                   observed, threshold, distance, lower_bound,
+                   num_draws, seed, chunk_size)
+    counts = {"draws": num_draws, "accepted": 0, "stopped": 0}
+    # A max-heap of the best draws, by distance.  The
+    # counter breaks ties in the order of acceptance.
+    best = []
+
+    def collect(results, f):
+        accepted, stopped = results
+        counts["stopped"] += stopped
+        for row, stats, d in accepted:
+            f.write("\t".join(repr(float(x)) for x in
+                               np.concatenate((row, stats, [d]))))
+            f.write("\n")
+            item = (-d, counts["accepted"], row, stats)
+            counts["accepted"] += 1
+            if len(best) < top_k:
+                heapq.heappush(best, item)
+            elif top_k > 0 and item > best[0]:
+                heapq.heapreplace(best, item)
+        f.flush()
+
+    with open(output, "w") as f:
+        f.write("\t".join(names + ["stat{}".format(i) for i in
+                                   range(len(observed))] + ["distance"]))
+        f.write("\n")
+        if num_workers == 1:
+            for task in tasks:
+                collect(_run_chunk(task), f)
+        else:
+            with multiprocessing.Pool(num_workers) as pool:
+                for results in pool.imap(_run_chunk, tasks):
+                    collect(results, f)
+
+    best.sort(key=lambda item: (-item[0], item[1]))
+    params = np.array([item[2] for item in best]).reshape(-1, len(names))
+    stats = np.array([item[3] for item in best]).reshape(-1, len(observed))
+    distances = np.array([-item[0] for item in best])
+    return params, stats, distances, counts
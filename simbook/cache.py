@@ -0,0 +1,152 @@
+import hashlib
+import inspect
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import numpy as np
+
+import simbook
+
+DEFAULT_DIRECTORY = ".simbook_cache"
+
+
+def _package_hash():
+    """
+    A digest of the source code of simbook,
+    so that changes to the simulators invalidate
+    cached results even without a version change.
+    """
+    h = hashlib.sha256()
+    root = pathlib.Path(simbook.__file__).parent
+    for path in sorted(root.rglob("*.py")):
+        h.update(str(path.relative_to(root)).encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def _dependency_versions():
+    """
+    The versions of the packages whose output may be
+    cached, so that upgrading them invalidates it.
+    """
+    versions = {"numpy": np.__version__}
+    for name in ("msprime", "tskit"):
+        try:
+            module = __import__(name)
+        except ImportError:
+            versions[name] = None
+        else:
+            versions[name] = module.__version__
+    return versions
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(i) for i in value]
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if hasattr(value, "__dict__") and not callable(value):
+        # Plain objects such as SizeHistory and
+        # DemographicEvent are keyed by their
+        # class and attributes.
+        cls = type(value)
+        return {"class": "{}.{}".format(cls.__module__, cls.__qualname__),
+                "attributes": _jsonable(vars(value))}
+    raise TypeError("cannot use a parameter of type {} in a cache "
+                    "key".format(type(value).__name__))
+
+
+def cache_key(simulator, seed, names, params):
+    """
+    Return the key under which the named results of
+    ``simulator(**params)`` with the given seed are stored.
+
+    The key is a SHA-256 digest of the simulator's name
+    and source code, the parameters, the seed, the names
+    of the results, the version and source code of
+    simbook, and the versions of NumPy, msprime,
+    and tskit.
+    """
+    try:
+        source = inspect.getsource(simulator)
+    except (OSError, TypeError):
+        source = None
+    key = {"simulator": "{}.{}".format(simulator.__module__,
+                                       simulator.__qualname__),
+           "source": source,
+           "params": _jsonable(params),
+           "seed": _jsonable(seed),
+           "names": list(names),
+           "version": simbook.__version__,
+           "package": _package_hash(),
+           "dependencies": _dependency_versions()}
+    text = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest(), key
+
+
+def cached(simulator, seed, names, directory=None, **params):
+    """
+    Return summary arrays from a simulation,
+    reusing stored results when they exist.
+
+    The simulator is called as
+    ``simulator(rng=rng, **params)``, where ``rng`` is
+    ``numpy.random.default_rng(seed)``.  It must return one
+    array per entry in ``names``.  The arrays are stored
+    as one ``.npy`` file per name, in a directory named
+    by :func:`cache_key`, and are returned memory-mapped
+    and read-only.
+
+    :param simulator: The function to run
+    :type simulator: callable
+    :param seed: The random number seed
+    :type seed: int
+    :param names: The names of the returned arrays
+    :type names: list
+    :param directory: Where results are stored.  If ``None``,
+                      the ``SIMBOOK_CACHE`` environment variable
+                      is used if set, otherwise ``.simbook_cache``
+                      in the working directory.
+    :type directory: str
+
+    :returns: One array per name
+    :rtype: tuple
+    """
+    if directory is None:
+        directory = os.environ.get("SIMBOOK_CACHE", DEFAULT_DIRECTORY)
+    directory = pathlib.Path(directory)
+    digest, key = cache_key(simulator, seed, names, params)
+    entry = directory / digest
+
+    if not entry.is_dir():
+        results = simulator(rng=np.random.default_rng(seed), **params)
+        if len(results) != len(names):
+            raise ValueError("the simulator returned {} arrays, "
+                             "but {} names were given".format(
+                                 len(results), len(names)))
+        directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary directory and then rename it,
+        # so that an interrupted run never leaves a partial
+        # entry behind.
+        tmp = pathlib.Path(tempfile.mkdtemp(dir=directory))
+        for name, values in zip(names, results):
+            np.save(tmp / "{}.npy".format(name), np.asarray(values))
+        with open(tmp / "key.json", "w") as f:
+            json.dump(key, f, indent=1)
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # Another process stored the same results first
+            shutil.rmtree(tmp)
+
+    return tuple(np.load(entry / "{}.npy".format(name), mmap_mode="r")
+                 for name in names)
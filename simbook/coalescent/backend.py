@@ -0,0 +1,52 @@
+"""
+Optional compilation of the simulators' inner loops.
+
+The inner loops are written as plain functions of
+integer and float sequences.  If Numba is installed,
+:func:`jit` compiles them; otherwise they run as
+ordinary Python.  The random numbers are always drawn
+by the caller, with NumPy, before a loop runs, so both
+backends give the same results for the same seed.
+
+The backend is chosen when this module is imported.
+Setting the ``SIMBOOK_BACKEND`` environment variable
+to ``"python"`` disables compilation even when Numba
+is available.
+"""
+import os
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None and os.environ.get("SIMBOOK_BACKEND") != "python":
+    BACKEND = "numba"
+else:
+    BACKEND = "python"
+
+
+def jit(func):
+    """
+    Compile a function with Numba if that backend is
+    in use, and return it unchanged otherwise.
+    """
+    if BACKEND == "numba":
+        return numba.njit(cache=True, nogil=True)(func)
+    return func
+
+
+def buffer(a):
+    """
+    Return a sequence for an inner loop to index.
+
+    Compiled code works on NumPy arrays directly, but
+    Python indexes lists much faster than arrays, one
+    element at a time.
+
+    :param a: An array
+    :type a: numpy.ndarray
+    """
+    if BACKEND == "numba":
+        return a
+    return a.tolist()
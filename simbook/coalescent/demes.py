@@ -0,0 +1,258 @@
+import numpy as np
+import tskit
+from simbook.tables import build_tables
+from simbook.coalescent.fenwick import FenwickTree
+from simbook.coalescent.replicates import replicates
+from simbook.coalescent.profiling import SimulationStats
+from simbook.coalescent.genealogy import Genealogy
+
+
+class _DemeState(object):
+    """
+    The lineages in each deme of :func:`simulate_demes`,
+    along with the sizes and migration rates that set the
+    total rate of events in each deme.
+
+    The rates are stored in a Fenwick tree.  Anything that
+    changes the lineages or size of a deme must call
+    :meth:`update`, and anything that changes a row of the
+    migration matrix must call :meth:`update_migration`.
+    """
+
+    def __init__(self, lineages, migration_matrix, sizes):
+        ndemes = len(lineages)
+        self.lineages = lineages
+        self.migration_matrix = migration_matrix
+        self.sizes = sizes
+        self.mig_out = [0.0]*ndemes
+        # Cumulative rates along each row, used to
+        # choose the destination of a migrant
+        self.mig_cum = np.zeros((ndemes, ndemes))
+        self.rates = FenwickTree(ndemes)
+        # The number of demes in which an event
+        # can happen.  We track this exactly because
+        # the Fenwick tree total is subject to
+        # rounding error.
+        self.nactive = 0
+        for deme in range(ndemes):
+            self.update_migration(deme)
+
+    def update(self, deme):
+        """
+        Set the total event rate in a deme.
+        """
+        n = len(self.lineages[deme])
+        old = self.rates[deme] > 0.
+        self.rates[deme] = (n*(n-1))/2./self.sizes[deme] + \
+            n*self.mig_out[deme]
+        self.nactive += int(self.rates[deme] > 0.) - int(old)
+
+    def update_migration(self, deme):
+        """
+        Update the migration rates out of a deme
+        after a change to its row of the migration matrix.
+        """
+        row = self.migration_matrix[deme]
+        self.mig_cum[deme] = np.cumsum(row)
+        self.mig_out[deme] = float(self.mig_cum[deme, -1])
+        self.update(deme)
+
+
+def simulate_demes(sample_sizes, migration_matrix, rng=None,
+                   num_replicates=None, tables=None,
+                   sizes=None, demographic_events=None,
+                   compact=False, profile=False):
+    """
+    Simulate a coalescent tree for a sample from any
+    number of demes.
+
+    Entry ``[i][j]`` of the migration matrix is the rate,
+    per lineage and per 2N generations, at which a lineage
+    in deme ``i`` moves to deme ``j`` (backwards in time).
+    The diagonal is ignored.  With k lineages in a deme of
+    size x, relative to N, the rate of coalescence in that
+    deme is ``k*(k-1)/2/x``.
+
+    The total rate of events in each deme is stored in a
+    Fenwick tree.  Choosing the deme of the next event,
+    and updating the rates of the one or two demes that
+    an event changes, take O(log K) time for K demes.
+
+    Demographic events are kept in a queue sorted by time.
+    Before each event, if the waiting time drawn from the
+    current rates would take the simulation past the next
+    demographic event, the simulation instead jumps to the
+    time of that event, applies it, and draws again.  This
+    is exact because waiting times are memoryless.
+
+    :param sample_sizes: The sample size in each deme
+    :type sample_sizes: list
+    :param migration_matrix: The K x K migration rates
+    :type migration_matrix: numpy.ndarray
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param num_replicates: If not ``None``, return a generator
+                           of this many replicates.
+    :type num_replicates: int
+    :param tables: A table collection to fill instead
+                   of allocating a new one.
+    :type tables: tskit.TableCollection
+    :param sizes: The size of each deme, relative to N.
+                  If ``None``, all demes have size 1.
+    :type sizes: list
+    :param demographic_events: Changes to the demes over time
+    :type demographic_events: list of
+        :class:`simbook.coalescent.demography.DemographicEvent`
+    :param compact: If ``True``, return a
+                    :class:`simbook.coalescent.genealogy.Genealogy`
+                    instead of a tree sequence.
+    :type compact: bool
+    :param profile: If ``True``, also return a
+                    :class:`SimulationStats` with the
+                    number of events of each type and the
+                    time spent in each phase of the simulation.
+                    The phases are ``setup``, ``events``
+                    (the whole event loop), and ``finalization``.
+    :type profile: bool
+    """
+    sample_sizes = [int(i) for i in sample_sizes]
+    ndemes = len(sample_sizes)
+    migmat = np.array(migration_matrix, dtype=np.float64)
+    if sizes is None:
+        sizes = [1.0]*ndemes
+    sizes = [float(i) for i in sizes]
+    if demographic_events is None:
+        demographic_events = []
+    if migmat.shape != (ndemes, ndemes):
+        raise ValueError("migration matrix must be K x K, "
+                         "where K is the number of demes")
+    if len(sizes) != ndemes:
+        raise ValueError("there must be one size per deme")
+    if any(i < 0 for i in sample_sizes):
+        raise ValueError("sample sizes must be >= 0")
+    if (migmat < 0).any():
+        raise ValueError("migration rates must be >= 0")
+    if any(i <= 0 for i in sizes):
+        raise ValueError("sizes must be > 0")
+    for event in demographic_events:
+        event.check(ndemes)
+    nsam = sum(sample_sizes)
+    if nsam < 2:
+        raise ValueError("total sample size must be > 1")
+    if num_replicates is not None:
+        return replicates(simulate_demes, num_replicates,
+                          sample_sizes, migration_matrix, rng=rng,
+                          sizes=sizes,
+                          demographic_events=demographic_events,
+                          compact=compact, profile=profile)
+    if rng is None:
+        rng = np.random
+    stats = SimulationStats() if profile else None
+
+    np.fill_diagonal(migmat, 0.)
+    events = sorted(demographic_events, key=lambda e: e.time)
+    next_event = 0
+
+    node_times = np.zeros(2*nsam - 1)
+    flags = np.zeros(2*nsam - 1, dtype=np.uint32)
+    flags[:nsam] = tskit.NODE_IS_SAMPLE
+    populations = np.repeat(np.arange(ndemes, dtype=np.int32),
+                            sample_sizes)
+    populations = np.concatenate(
+        (populations, np.zeros(nsam - 1, dtype=np.int32)))
+    parents = np.zeros(2*nsam - 2, dtype=np.int32)
+    children = np.zeros(2*nsam - 2, dtype=np.int32)
+
+    lineages = []
+    first = 0
+    for n in sample_sizes:
+        lineages.append(list(range(first, first + n)))
+        first += n
+    state = _DemeState(lineages, migmat, sizes)
+    # Events modify these in place, so the
+    # local names stay valid.
+    rates = state.rates
+    mig_out = state.mig_out
+    mig_cum = state.mig_cum
+
+    time = 0.0
+    total_n = nsam
+    nmig = 0
+    if stats is not None:
+        stats.lap("setup")
+    while total_n > 1:
+        if state.nactive > 0:
+            total = rates.total()
+            wait = rng.exponential(1./total)
+        elif next_event < len(events):
+            wait = np.inf
+        else:
+            raise ValueError("the remaining lineages can never "
+                             "coalesce, because the demes are "
+                             "not connected by migration")
+        if next_event < len(events) and \
+                time + wait >= events[next_event].time:
+            time = events[next_event].time
+            events[next_event].apply(state, rng)
+            next_event += 1
+            continue
+        time += wait
+
+        # Choose the deme proportional to its rate
+        deme = rates.find(rng.uniform()*total)
+        while rates[deme] == 0.:
+            deme = rates.find(rng.uniform()*total)
+        here = lineages[deme]
+        n = len(here)
+
+        if rng.uniform()*rates[deme] < (n*(n-1))/2./sizes[deme]:
+            ancestor = 2*nsam - total_n
+            node_times[ancestor] = time
+            populations[ancestor] = deme
+            p = int(rng.uniform()*n)
+            c1 = here[p]
+            here[p] = here[-1]
+            here.pop()
+            p = int(rng.uniform()*(n-1))
+            c2 = here[p]
+            here[p] = ancestor
+            if c1 > c2:
+                c1, c2 = c2, c1
+            e = 2*(ancestor - nsam)
+            parents[e:e+2] = ancestor
+            children[e] = c1
+            children[e+1] = c2
+            total_n -= 1
+            state.update(deme)
+        else:
+            dest = int(np.searchsorted(mig_cum[deme],
+                                       rng.uniform()*mig_out[deme],
+                                       side="right"))
+            dest = min(dest, ndemes - 1)
+            p = int(rng.uniform()*n)
+            migrant = here[p]
+            here[p] = here[-1]
+            here.pop()
+            lineages[dest].append(migrant)
+            state.update(deme)
+            state.update(dest)
+            nmig += 1
+    if stats is not None:
+        stats.lap("events")
+        stats.events["coalescence"] += nsam - 1
+        stats.events["migration"] += nmig
+        stats.events["demographic"] += next_event
+
+    if compact:
+        ts = Genealogy.from_edges(node_times, parents, children, nsam,
+                                  populations, ndemes)
+    else:
+        tc = build_tables(node_times, flags, parents, children,
+                          population=populations,
+                          num_populations=ndemes, tables=tables)
+        ts = tc.tree_sequence()
+    if stats is not None:
+        stats.lap("finalization")
+        return ts, stats
+    return ts
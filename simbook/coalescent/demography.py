@@ -0,0 +1,292 @@
+import bisect
+import math
+
+import numpy as np
+
+
+class SizeHistory(object):
+    """
+    A history of population size made up of epochs.
+    Within each epoch, the size is either constant or
+    changes exponentially.
+
+    Time is measured backwards from the present in units
+    of 2N generations, and sizes are relative to N.  During
+    the epoch starting at time ``s`` with size ``x`` and
+    growth rate ``g``, the size at time ``t`` is
+    ``x*exp(-g*(t - s))``, following the msprime convention
+    that a positive growth rate means that the population
+    grows forwards in time.
+
+    With k lineages, the rate of coalescence at time t is
+    ``k*(k-1)/2/size(t)``.  A waiting time drawn for a
+    population of constant size 1 is turned into a waiting
+    time under this history by inverting the cumulative
+    intensity ``L(t)``, the integral of ``1/size`` from 0 to t.
+    Both ``L`` and its inverse have closed forms, so
+    no numerical integration or rejection sampling is needed.
+
+    :param start_times: The start time of each epoch.
+                        The first must be 0.
+    :type start_times: list
+    :param sizes: The size at the start of each epoch
+    :type sizes: list
+    :param growth_rates: The growth rate in each epoch.
+                         If ``None``, all sizes are constant.
+    :type growth_rates: list
+    """
+
+    def __init__(self, start_times, sizes, growth_rates=None):
+        if growth_rates is None:
+            growth_rates = [0.0]*len(sizes)
+        if not len(start_times) == len(sizes) == len(growth_rates):
+            raise ValueError("start times, sizes, and growth rates "
+                             "must have the same length")
+        if len(start_times) == 0 or start_times[0] != 0:
+            raise ValueError("the first epoch must start at time 0")
+        if any(b <= a for a, b in zip(start_times, start_times[1:])):
+            raise ValueError("start times must be increasing")
+        if any(x <= 0 for x in sizes):
+            raise ValueError("sizes must be > 0")
+        if growth_rates[-1] < 0:
+            # The population would get larger and larger
+            # back in time, and the lineages might
+            # never coalesce.
+            raise ValueError("the growth rate in the final epoch "
+                             "must be >= 0")
+
+        self.start_times = [float(i) for i in start_times]
+        self.sizes = [float(i) for i in sizes]
+        self.growth_rates = [float(i) for i in growth_rates]
+        # The cumulative intensity at the start of each epoch
+        self.start_intensities = [0.0]
+        for j in range(len(start_times) - 1):
+            dt = self.start_times[j+1] - self.start_times[j]
+            self.start_intensities.append(
+                self.start_intensities[-1] + self._epoch_intensity(j, dt))
+
+    @classmethod
+    def constant(cls, size=1.0):
+        """
+        A population of constant size.
+        """
+        return cls([0.0], [size])
+
+    @classmethod
+    def exponential(cls, growth_rate, size=1.0):
+        """
+        A population of size ``size`` at present that
+        has been changing exponentially at the given rate.
+        """
+        return cls([0.0], [size], [growth_rate])
+
+    def _epoch_intensity(self, j, dt):
+        g = self.growth_rates[j]
+        if g == 0.:
+            return dt/self.sizes[j]
+        return math.expm1(g*dt)/(g*self.sizes[j])
+
+    def size(self, t):
+        """
+        Return the size at time t.
+        """
+        j = bisect.bisect_right(self.start_times, t) - 1
+        return self.sizes[j]*math.exp(-self.growth_rates[j] *
+                                      (t - self.start_times[j]))
+
+    def inverse(self, x):
+        """
+        Return the times at which the cumulative intensity
+        reaches each of the values in ``x``.
+
+        A waiting time drawn for a population of constant
+        size becomes a time in this history by inverting the
+        cumulative intensity, so this converts cumulative
+        sums of waiting times, starting from time 0.
+
+        :param x: Cumulative intensities
+        :type x: numpy.ndarray
+
+        :rtype: numpy.ndarray
+        """
+        x = np.asarray(x, dtype=np.float64)
+        starts = np.array(self.start_intensities)
+        j = np.searchsorted(starts, x, side="right") - 1
+        r = x - starts[j]
+        g = np.array(self.growth_rates)[j]
+        size = np.array(self.sizes)[j]
+        t = np.array(self.start_times)[j]
+        growing = g != 0.
+        # Avoid dividing by zero for the epochs of constant size
+        safe_g = np.where(growing, g, 1.)
+        return t + np.where(growing, np.log1p(r*safe_g*size)/safe_g,
+                            r*size)
+
+
+class DemographicEvent(object):
+    """
+    A change to the demes of a structured coalescent
+    simulation at a given time.
+
+    Events are applied by
+    :func:`simbook.coalescent.demes.simulate_demes`
+    when the simulation reaches their time.  Each event
+    changes the lineages, sizes, or migration rates of the
+    demes through the simulation state, and then asks it
+    to update the event rates of the demes it touched.
+
+    :param time: The time of the event, in units
+                 of 2N generations
+    :type time: float
+    """
+
+    def __init__(self, time):
+        if time < 0:
+            raise ValueError("event times must be >= 0")
+        self.time = float(time)
+
+    def _check_deme(self, deme, ndemes):
+        if not 0 <= deme < ndemes:
+            raise ValueError("deme {} does not exist".format(deme))
+
+    def check(self, ndemes):
+        """
+        Raise ValueError if the event refers to a
+        deme that does not exist.
+        """
+        raise NotImplementedError
+
+    def apply(self, state, rng):
+        """
+        Apply the event to the simulation state.
+        """
+        raise NotImplementedError
+
+
+class MassMigration(DemographicEvent):
+    """
+    Move each lineage in deme ``source`` to deme ``dest``
+    with probability ``proportion``.  Backwards in time,
+    a split of ``dest`` into ``source`` and ``dest`` is a
+    mass migration with proportion 1, and an admixture
+    pulse is one with a proportion less than 1.
+
+    The number of migrants is drawn from a binomial
+    distribution and the migrants are chosen by a partial
+    Fisher-Yates shuffle, so the cost is proportional to
+    the number of lineages moved.
+
+    :param time: The time of the event
+    :type time: float
+    :param source: The deme that lineages leave
+    :type source: int
+    :param dest: The deme that lineages enter
+    :type dest: int
+    :param proportion: The probability that each lineage moves
+    :type proportion: float
+    """
+
+    def __init__(self, time, source, dest, proportion=1.0):
+        super(MassMigration, self).__init__(time)
+        if not 0. <= proportion <= 1.:
+            raise ValueError("proportion must be between 0 and 1")
+        if source == dest:
+            raise ValueError("source and dest must differ")
+        self.source = int(source)
+        self.dest = int(dest)
+        self.proportion = float(proportion)
+
+    def check(self, ndemes):
+        self._check_deme(self.source, ndemes)
+        self._check_deme(self.dest, ndemes)
+
+    def apply(self, state, rng):
+        here = state.lineages[self.source]
+        there = state.lineages[self.dest]
+        k = len(here)
+        if self.proportion == 1.:
+            there.extend(here)
+            del here[:]
+        else:
+            m = int(rng.binomial(k, self.proportion))
+            # Move m randomly chosen lineages to the end
+            for i in range(m):
+                j = int(rng.uniform()*(k - i))
+                here[j], here[k-1-i] = here[k-1-i], here[j]
+            there.extend(here[k-m:])
+            del here[k-m:]
+        state.update(self.source)
+        state.update(self.dest)
+
+
+class MigrationRateChange(DemographicEvent):
+    """
+    Change the rate at which lineages migrate
+    from deme ``i`` to deme ``j``, where ``(i, j)`` is
+    ``matrix_index``.  If ``matrix_index`` is ``None``,
+    change all of the rates between distinct demes.
+
+    :param time: The time of the event
+    :type time: float
+    :param rate: The new per-lineage migration rate
+    :type rate: float
+    :param matrix_index: The entry of the migration
+                         matrix to change
+    :type matrix_index: tuple
+    """
+
+    def __init__(self, time, rate, matrix_index=None):
+        super(MigrationRateChange, self).__init__(time)
+        if rate < 0:
+            raise ValueError("migration rates must be >= 0")
+        if matrix_index is not None:
+            matrix_index = tuple(int(i) for i in matrix_index)
+            if len(matrix_index) != 2 or matrix_index[0] == matrix_index[1]:
+                raise ValueError("matrix_index must be a pair "
+                                 "of distinct demes")
+        self.rate = float(rate)
+        self.matrix_index = matrix_index
+
+    def check(self, ndemes):
+        if self.matrix_index is not None:
+            for deme in self.matrix_index:
+                self._check_deme(deme, ndemes)
+
+    def apply(self, state, rng):
+        if self.matrix_index is None:
+            state.migration_matrix[:] = self.rate
+            np.fill_diagonal(state.migration_matrix, 0.)
+            rows = range(len(state.lineages))
+        else:
+            state.migration_matrix[self.matrix_index] = self.rate
+            rows = [self.matrix_index[0]]
+        for deme in rows:
+            state.update_migration(deme)
+
+
+class DemeSizeChange(DemographicEvent):
+    """
+    Change the size of a deme, relative to N.
+    The size stays constant until the next change.
+
+    :param time: The time of the event
+    :type time: float
+    :param deme: The deme whose size changes
+    :type deme: int
+    :param size: The new size
+    :type size: float
+    """
+
+    def __init__(self, time, deme, size):
+        super(DemeSizeChange, self).__init__(time)
+        if size <= 0:
+            raise ValueError("sizes must be > 0")
+        self.deme = int(deme)
+        self.size = float(size)
+
+    def check(self, ndemes):
+        self._check_deme(self.deme, ndemes)
+
+    def apply(self, state, rng):
+        state.sizes[self.deme] = self.size
+        state.update(self.deme)
@@ -0,0 +1,72 @@
+class FenwickTree(object):
+    """
+    A Fenwick (binary indexed) tree of non-negative values.
+
+    Changing one value, computing a prefix sum,
+    and finding the index at which the prefix sum exceeds
+    a given value all take O(log n) time.  This makes
+    it possible to choose an index with probability
+    proportional to its value without scanning all values.
+
+    :param n: The number of values, which are initially zero
+    :type n: int
+    """
+
+    def __init__(self, n):
+        self.values = [0.0]*n
+        self.tree = [0.0]*(n + 1)
+        self.n = n
+        self.top = 1
+        while self.top*2 <= n:
+            self.top *= 2
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __setitem__(self, i, value):
+        delta = value - self.values[i]
+        self.values[i] = value
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, i):
+        """
+        Return the sum of the first ``i`` values.
+        """
+        s = 0.0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def total(self):
+        """
+        Return the sum of all values.
+        """
+        return self.prefix_sum(self.n)
+
+    def find(self, value):
+        """
+        Return the smallest index ``i`` such that
+        the sum of the first ``i + 1`` values
+        exceeds ``value``.
+
+        Rounding error can make the result an
+        index whose value is zero, so callers
+        sampling proportional to the values should
+        check for that.
+        """
+        i = 0
+        step = self.top
+        while step > 0:
+            j = i + step
+            if j <= self.n and self.tree[j] <= value:
+                i = j
+                value -= self.tree[j]
+            step //= 2
+        return min(i, self.n - 1)
@@ -0,0 +1,154 @@
+import numpy as np
+import tskit
+from simbook.tables import build_tables
+from simbook.coalescent.backend import jit, buffer
+
+
+@jit
+def _add_subtree_sizes(order, parent, sizes):
+    # Children come before their parents in
+    # time order, so each node's count is final
+    # by the time it is added to its parent's.
+    for i in range(len(order)):
+        u = order[i]
+        p = parent[u]
+        if p >= 0:
+            sizes[p] += sizes[u]
+
+
+class Genealogy(object):
+    """
+    A single genealogy, stored as arrays.
+
+    This holds the same information as a tree sequence
+    with one tree, but without tables, metadata, or
+    indexes, so that many replicates can be kept in memory
+    at once.  Node ``u`` has time ``time[u]`` and parent
+    ``parent[u]``, which is -1 for the root.  The first
+    ``num_samples`` nodes are the samples.
+
+    The tree sequence is only built when
+    :meth:`tree_sequence` is called.
+
+    :param parent: The parent of each node
+    :type parent: numpy.ndarray
+    :param time: The time of each node
+    :type time: numpy.ndarray
+    :param num_samples: The number of samples
+    :type num_samples: int
+    :param population: The population of each node, or ``None``
+                       if there is only one population.
+    :type population: numpy.ndarray
+    :param num_populations: The number of populations
+    :type num_populations: int
+    """
+
+    __slots__ = ("parent", "time", "population",
+                 "num_samples", "num_populations")
+
+    def __init__(self, parent, time, num_samples, population=None,
+                 num_populations=0):
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.time = np.asarray(time, dtype=np.float64)
+        if self.parent.shape != self.time.shape:
+            raise ValueError("parent and time must have the same length")
+        if population is not None:
+            population = np.asarray(population, dtype=np.int32)
+            if population.shape != self.time.shape:
+                raise ValueError("population and time must have "
+                                 "the same length")
+        self.population = population
+        self.num_samples = int(num_samples)
+        self.num_populations = int(num_populations)
+
+    @classmethod
+    def from_edges(cls, time, parent, child, num_samples,
+                   population=None, num_populations=0):
+        """
+        Make a genealogy from node times and the
+        parents and children of its edges, as filled in
+        by the simulators.
+        """
+        node_parent = np.full(len(time), -1, dtype=np.int32)
+        node_parent[child] = parent
+        return cls(node_parent, time, num_samples, population,
+                   num_populations)
+
+    @property
+    def num_nodes(self):
+        return len(self.time)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the arrays.
+        """
+        total = self.parent.nbytes + self.time.nbytes
+        if self.population is not None:
+            total += self.population.nbytes
+        return total
+
+    @property
+    def root(self):
+        return int(np.flatnonzero(self.parent < 0)[0])
+
+    @property
+    def tmrca(self):
+        """
+        The time to the most recent common ancestor
+        of the samples.
+        """
+        return float(self.time[self.root])
+
+    def branch_lengths(self):
+        """
+        Return the length of the branch above each node,
+        which is zero for the root.
+
+        :rtype: numpy.ndarray
+        """
+        lengths = np.zeros(self.num_nodes)
+        has_parent = self.parent >= 0
+        lengths[has_parent] = self.time[self.parent[has_parent]] - \
+            self.time[has_parent]
+        return lengths
+
+    @property
+    def total_branch_length(self):
+        return float(self.branch_lengths().sum())
+
+    def subtree_sizes(self):
+        """
+        Return the number of samples below each node.
+
+        :rtype: numpy.ndarray
+        """
+        order = np.argsort(self.time, kind="stable")
+        sizes = np.zeros(self.num_nodes, dtype=np.int64)
+        sizes[:self.num_samples] = 1
+        sizes = buffer(sizes)
+        _add_subtree_sizes(buffer(order), buffer(self.parent), sizes)
+        return np.asarray(sizes, dtype=np.int64)
+
+    def tree_sequence(self, tables=None):
+        """
+        Build the equivalent tree sequence.
+
+        :param tables: A table collection to fill instead
+                       of allocating a new one.
+        :type tables: tskit.TableCollection
+
+        :rtype: tskit.TreeSequence
+        """
+        flags = np.zeros(self.num_nodes, dtype=np.uint32)
+        flags[:self.num_samples] = tskit.NODE_IS_SAMPLE
+        child = np.flatnonzero(self.parent >= 0).astype(np.int32)
+        parent = self.parent[child]
+        # Edges must be sorted by the time of the parent
+        # and then by parent and child id.
+        order = np.lexsort((child, parent, self.time[parent]))
+        tc = build_tables(self.time, flags, parent[order], child[order],
+                          population=self.population,
+                          num_populations=self.num_populations,
+                          tables=tables)
+        return tc.tree_sequence()
@@ -1,8 +1,69 @@
 import tskit
 import numpy as np
+from simbook.tables import build_tables
+from simbook.coalescent.replicates import replicates
+from simbook.coalescent.profiling import SimulationStats
+from simbook.coalescent.backend import jit, buffer
+from simbook.coalescent.genealogy import Genealogy
 
 
-def simulate(nsam: int):
+@jit
+def _swaps(nodes, p1, p2, children):
+    """
+    The swap steps of the algorithm.  At step i, the
+    lineages at positions p1[i] and then p2[i] of
+    ``nodes`` are removed and replaced by their
+    ancestor, node nsam + i, whose two edges are
+    written to ``children[2*i:2*i+2]``.
+    """
+    nsam = len(nodes)
+    for i in range(nsam - 1):
+        last = nsam - 1 - i
+        p = p1[i]
+        c1 = nodes[p]
+        nodes[p] = nodes[last]
+        p = p2[i]
+        c2 = nodes[p]
+        nodes[p] = nsam + i
+        # An edge table requires that child nodes
+        # be sorted in increasing order per parent
+        if c1 > c2:
+            c1, c2 = c2, c1
+        children[2*i] = c1
+        children[2*i+1] = c2
+
+
+def _coalesce(nsam, rng, size_history, stats):
+    """
+    Return the node times and edge children
+    of a simulated genealogy.
+    """
+    # Generate all waiting times at once, in units
+    # of 2N generations.  While there are n lineages,
+    # the rate of coalescence is n(n-1)/2.
+    n = np.arange(nsam, 1, -1)
+    rcoal = (n*(n-1))/2.
+    node_times = np.zeros(2*nsam - 1)
+    node_times[nsam:] = np.cumsum(rng.exponential(1., nsam - 1)/rcoal)
+    if size_history is not None:
+        node_times[nsam:] = size_history.inverse(node_times[nsam:])
+    if stats is not None:
+        stats.lap("rates")
+
+    # Uniform choices from 0, ..., n - 1 and
+    # 0, ..., n - 2 for every step
+    p1 = (rng.uniform(size=nsam - 1)*n).astype(np.int32)
+    p2 = (rng.uniform(size=nsam - 1)*(n-1)).astype(np.int32)
+    nodes = buffer(np.arange(nsam, dtype=np.int32))
+    children = buffer(np.zeros(2*nsam - 2, dtype=np.int32))
+    _swaps(nodes, buffer(p1), buffer(p2), children)
+    if stats is not None:
+        stats.lap("selection")
+    return node_times, np.asarray(children, dtype=np.int32)
+
+
+def simulate(nsam: int, rng=None, num_replicates=None, tables=None,
+             profile=False, size_history=None, compact=False):
     """
     The linear-time algorithm of Hudson, 1990,
     adapted to use tree sequences
@@ -12,55 +73,232 @@ def simulate(nsam: int):
     “Gene Genealogies and the Coalescent Process.”
     Oxford Surveys in Evolutionary Biology 7 (1): 44.
 
-    Time is scaled in units of 2N generations.
+    Time is scaled in units of 2N generations,
+    where N is the population size at present.
+    If the size changes over time, the waiting times
+    are drawn as for a population of constant size and
+    then rescaled using the size history.
+
+    All random numbers are drawn in bulk before the
+    swap steps of the algorithm, which run in a loop
+    that is compiled if Numba is installed (see
+    :mod:`simbook.coalescent.backend`).  The results
+    for a given seed do not depend on the backend.
+    This is also the path for large samples: the work
+    and memory are linear in ``nsam``, so samples of a
+    million or more are practical.
 
     :param nsam: The sample size
     :type nsam: int
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param num_replicates: If not ``None``, return a generator
+                           of this many replicates.
+    :type num_replicates: int
+    :param tables: A table collection to fill instead
+                   of allocating a new one.
+    :type tables: tskit.TableCollection
+    :param profile: If ``True``, also return a
+                    :class:`SimulationStats` with the
+                    number of events and the time spent
+                    in each phase of the simulation.  The
+                    phases are ``rates`` (drawing the
+                    waiting times), ``selection`` (drawing
+                    the lineages and running the swap loop,
+                    which also writes the edge children),
+                    ``recording`` (the edge parents), and
+                    ``finalization`` (building the output).
+    :type profile: bool
+    :param size_history: Changes in population size over
+                         time.  If ``None``, the size is constant.
+    :type size_history: simbook.coalescent.demography.SizeHistory
+    :param compact: If ``True``, return a
+                    :class:`simbook.coalescent.genealogy.Genealogy`
+                    instead of a tree sequence.
+    :type compact: bool
     """
-    tc = tskit.TableCollection(1)
-
-    nodes = np.arange(2*nsam - 1, dtype=np.int32)
-    for i in range(nsam):
-        tc.nodes.add_row(time=0.0, flags=tskit.NODE_IS_SAMPLE)
-    time = 0.0
-    n = nsam
-    while n > 1:
-        # Generate time to next coalescent event,
-        # in units of 2N generations.
-        rcoal = (n*(n-1))/2.
-        tcoal = np.random.exponential(1./rcoal)
-        time += tcoal
-
-        # Register a new ancestor node.
-        # The node is not a sample, 
-        # so its flag is zero
-        tc.nodes.add_row(time=time,
-                         flags=0)
-        # This is the index of the
-        # ancestor node
-        ancestor = 2*nsam - n
-
-        # Perform the swap steps
-        # of the algorithm
-        p = np.random.choice(n, 1)[0]
-        c1 = nodes[p]
-        nodes[p] = nodes[n-1]
-        p = np.random.choice(n-1, 1)[0]
-        c2 = nodes[p]
-        nodes[p] = nodes[ancestor]
+    if num_replicates is not None:
+        return replicates(simulate, num_replicates, nsam, rng=rng,
+                          profile=profile, size_history=size_history,
+                          compact=compact)
+    if rng is None:
+        rng = np.random
+    stats = SimulationStats() if profile else None
 
-        # Both c1 an c2 have the same parental
-        # node (nodes[ancestor]).  An edge
-        # table requires that child nodes
-        # be sorted in increasing order
-        # per parent, so we enforce that here
-        if c1 > c2:
-            c1, c2 = c2, c1
-        # Record the edges
-        tc.edges.add_row(parent=ancestor, child=c1,
-                         left=0.0, right=1.0)
-        tc.edges.add_row(parent=ancestor, child=c2,
-                         left=0.0, right=1.0)
-        n -= 1
-
-    return tc.tree_sequence()
+    # We know in advance that there will be
+    # 2*nsam - 1 nodes and 2*nsam - 2 edges,
+    # so we fill arrays and build the tables
+    # from them at the end.
+    flags = np.zeros(2*nsam - 1, dtype=np.uint32)
+    flags[:nsam] = tskit.NODE_IS_SAMPLE
+    if stats is not None:
+        stats.lap("setup")
+
+    node_times, children = _coalesce(nsam, rng, size_history, stats)
+    # The i-th coalescence creates node nsam + i,
+    # which is the parent of edges 2i and 2i + 1.
+    parents = np.repeat(np.arange(nsam, 2*nsam - 1, dtype=np.int32), 2)
+    if stats is not None:
+        stats.lap("recording")
+        stats.events["coalescence"] += nsam - 1
+
+    if compact:
+        ts = Genealogy.from_edges(node_times, parents, children, nsam)
+    else:
+        tc = build_tables(node_times, flags, parents, children,
+                          tables=tables)
+        ts = tc.tree_sequence()
+    if stats is not None:
+        stats.lap("finalization")
+        return ts, stats
+    return ts
+
+
+def simulate_replicates(nsam: int, num_replicates: int,
+                        block_size: int = 10000, rng=None,
+                        size_history=None):
+    """
+    Run many independent replicates of :func:`simulate`
+    at once.
+
+    Rather than looping over replicates, each step of the
+    algorithm is applied to a whole block of replicates
+    using NumPy arrays.  All coalescence times for a block
+    are generated in a single call, as are the choices
+    of which lineages merge at each step.
+
+    The output has the same distribution as repeated calls
+    to :func:`simulate`.  Node ``i`` of replicate ``r`` has
+    time ``time[r, i]``.  The first ``nsam`` nodes are the
+    samples, and the ``j``-th edge of each replicate
+    connects ``parent[j]`` to ``child[r, j]``, in the
+    same order that :func:`simulate` records them.  The
+    i-th coalescence always creates node ``nsam + i``, so
+    the edge parents are the same in every replicate and
+    are returned once, to be broadcast against the other
+    arrays.
+
+    :param nsam: The sample size
+    :type nsam: int
+    :param num_replicates: The number of replicates
+    :type num_replicates: int
+    :param block_size: The number of replicates simulated together
+    :type block_size: int
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param size_history: Changes in population size over
+                         time.  If ``None``, the size is constant.
+    :type size_history: simbook.coalescent.demography.SizeHistory
+
+    :returns: Node times, edge parents, and edge children,
+              with shapes ``(num_replicates, 2*nsam - 1)``,
+              ``(2*nsam - 2,)``, and
+              ``(num_replicates, 2*nsam - 2)``, respectively.
+    :rtype: tuple
+    """
+    if nsam < 2:
+        raise ValueError("sample size must be > 1")
+    if num_replicates < 0:
+        raise ValueError("number of replicates must be >= 0")
+    if block_size < 1:
+        raise ValueError("block size must be > 0")
+    if rng is None:
+        rng = np.random
+
+    nnodes = 2*nsam - 1
+    time = np.zeros((num_replicates, nnodes))
+    # The parents do not depend on the replicate:
+    # the i-th coalescence creates node nsam + i,
+    # which is the parent of edges 2i and 2i + 1.
+    parent = np.repeat(np.arange(nsam, nnodes, dtype=np.int32), 2)
+    child = np.zeros((num_replicates, nnodes - 1), dtype=np.int32)
+
+    # Number of lineages present before each
+    # coalescence, and the corresponding rates.
+    n = np.arange(nsam, 1, -1)
+    rcoal = (n*(n-1))/2.
+
+    for start in range(0, num_replicates, block_size):
+        stop = min(start + block_size, num_replicates)
+        nreps = stop - start
+        rows = np.arange(nreps)
+
+        # All waiting times for the block in one call.
+        # Exponential deviates are scaled to the
+        # rate at each step and accumulated.
+        tcoal = rng.exponential(1., (nreps, nsam - 1))/rcoal
+        time[start:stop, nsam:] = np.cumsum(tcoal, axis=1)
+        if size_history is not None:
+            time[start:stop, nsam:] = \
+                size_history.inverse(time[start:stop, nsam:])
+
+        # All choices of lineages for the block in one call.
+        # Scaling a uniform deviate by n and truncating
+        # is a uniform choice from 0, 1, ..., n - 1.
+        u = rng.uniform(size=(nreps, nsam - 1, 2))
+        p1 = (u[:, :, 0]*n).astype(np.int32)
+        p2 = (u[:, :, 1]*(n-1)).astype(np.int32)
+
+        nodes = np.tile(np.arange(nsam, dtype=np.int32), (nreps, 1))
+        for i in range(nsam - 1):
+            # The swap steps of the algorithm,
+            # applied to every replicate at once
+            ancestor = nsam + i
+            p = p1[:, i]
+            c1 = nodes[rows, p]
+            nodes[rows, p] = nodes[:, n[i]-1]
+            p = p2[:, i]
+            c2 = nodes[rows, p]
+            nodes[rows, p] = ancestor
+            child[start:stop, 2*i] = np.minimum(c1, c2)
+            child[start:stop, 2*i+1] = np.maximum(c1, c2)
+
+    return time, parent, child
+
+
+def simulate_summaries(nsam: int, num_replicates: int, rng=None,
+                       size_history=None):
+    """
+    Return the time to the most recent common
+    ancestor (TMRCA) and the total time on the
+    tree (TTOT) for many replicates of :func:`simulate`,
+    without building any trees.
+
+    Neither quantity depends on the topology.
+    While there are n lineages, the tree grows
+    by n times the waiting time to the next
+    coalescence, so both are sums over the
+    waiting times.
+
+    :param nsam: The sample size
+    :type nsam: int
+    :param num_replicates: The number of replicates
+    :type num_replicates: int
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param size_history: Changes in population size over
+                         time.  If ``None``, the size is constant.
+    :type size_history: simbook.coalescent.demography.SizeHistory
+
+    :returns: TMRCA and TTOT, each of length ``num_replicates``
+    :rtype: tuple
+    """
+    if nsam < 2:
+        raise ValueError("sample size must be > 1")
+    if num_replicates < 0:
+        raise ValueError("number of replicates must be >= 0")
+    if rng is None:
+        rng = np.random
+
+    n = np.arange(nsam, 1, -1)
+    rcoal = (n*(n-1))/2.
+    tcoal = rng.exponential(1., (num_replicates, nsam - 1))/rcoal
+    if size_history is not None:
+        times = size_history.inverse(np.cumsum(tcoal, axis=1))
+        tcoal = np.diff(times, axis=1, prepend=0.)
+    tmrca = tcoal.sum(axis=1)
+    ttot = (tcoal*n).sum(axis=1)
+    return tmrca, ttot
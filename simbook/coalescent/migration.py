@@ -1,91 +1,344 @@
 import numpy as np
 import tskit
+from simbook.tables import build_tables
+from simbook.coalescent.replicates import replicates
+from simbook.coalescent.profiling import SimulationStats
+from simbook.coalescent.backend import jit, buffer
+from simbook.coalescent.genealogy import Genealogy
 
 
-def _get_rates(config, migrate):
-    rcoal0 = (config[0]*(config[0]-1))/2.
-    rcoal1 = (config[1]*(config[1]-1))/2.
-    rcoal = rcoal0+rcoal1
-    total_n = config.sum()
-    if rcoal > 0.:
-        tcoal = np.random.exponential(1./rcoal)
-    else:
-        tcoal = np.finfo(np.float).max
-    if migrate > 0.:
-        tmig = np.random.exponential(1./(total_n*migrate))
-    else:
-        tmig = np.finfo(np.float).max
-    return tcoal, tmig, rcoal0, rcoal1
+@jit
+def _two_demes_events(lineages, config, nsam, total_n, time, migrate,
+                      expo, unif, node_times, populations, children):
+    """
+    Run events of :func:`simulate_two_demes` until one
+    lineage is left or the random numbers run out.
 
+    Event i uses the exponential deviates ``expo[2*i:2*i+2]``
+    and the uniform deviates ``unif[3*i:3*i+3]``.  The
+    lineages in deme d are ``lineages[d*nsam:d*nsam + config[d]]``.
 
-def _pick_migrant(config):
-    p0 = config[0]/(config[0] + config[1])
-    if np.random.uniform() < p0:
-        return 0, 1
-    return 1, 0
+    Returns the number of lineages left, the current
+    time, the number of events, and the number of those
+    events that were migrations.  If there are fewer
+    events than random numbers allow and more than one
+    lineage is left, the lineages can never coalesce.
+    """
+    nevents = len(expo)//2
+    nmig = 0
+    i = 0
+    while total_n > 1 and i < nevents:
+        n0 = config[0]
+        n1 = config[1]
+        rcoal0 = (n0*(n0-1))/2.
+        rcoal1 = (n1*(n1-1))/2.
+        rcoal = rcoal0 + rcoal1
+        if rcoal == 0. and migrate == 0.:
+            break
+        # The times to the next coalescence and to
+        # the next migration.  The first event wins.
+        tcoal = np.inf
+        if rcoal > 0.:
+            tcoal = expo[2*i]/rcoal
+        tmig = np.inf
+        if migrate > 0.:
+            tmig = expo[2*i+1]/(total_n*migrate)
+
+        if tmig < tcoal:
+            time += tmig
+            # Remove a random lineage from the
+            # source deme and append it to the
+            # destination deme
+            source = 0
+            if unif[3*i] >= n0/(n0 + n1):
+                source = 1
+            dest = 1 - source
+            base = source*nsam
+            p = int(unif[3*i+1]*config[source])
+            migrant = lineages[base + p]
+            lineages[base + p] = lineages[base + config[source] - 1]
+            lineages[dest*nsam + config[dest]] = migrant
+            config[source] -= 1
+            config[dest] += 1
+            nmig += 1
+        else:
+            time += tcoal
+            deme = 0
+            if unif[3*i] >= rcoal0/rcoal:
+                deme = 1
+            ancestor = 2*nsam - total_n
+            # The swap steps of Hudson's algorithm,
+            # applied to the lineages of one deme
+            base = deme*nsam
+            n = config[deme]
+            p = int(unif[3*i+1]*n)
+            c1 = lineages[base + p]
+            lineages[base + p] = lineages[base + n - 1]
+            p = int(unif[3*i+2]*(n-1))
+            c2 = lineages[base + p]
+            lineages[base + p] = ancestor
+            config[deme] -= 1
+            total_n -= 1
+            if c1 > c2:
+                c1, c2 = c2, c1
+            node_times[ancestor] = time
+            populations[ancestor] = deme
+            e = 2*(ancestor - nsam)
+            children[e] = c1
+            children[e+1] = c2
+        i += 1
+    return total_n, time, i, nmig
 
 
-def simulate_two_demes(n0, n1, migrate):
+def _run_two_demes(n0, n1, migrate, rng, node_times, populations,
+                   children, stats=None):
+    """
+    Simulate one tree of :func:`simulate_two_demes`,
+    filling the ancestors' entries of ``node_times``,
+    ``populations``, and ``children``.
+    """
+    nsam = n0 + n1
+    # The nodes currently present in deme d are
+    # lineages[d*nsam:d*nsam + config[d]].  Lineages
+    # are only ever chosen by their position, so
+    # removing one is a swap with the last entry of
+    # its deme, and each event takes constant time.
+    lineages = np.full(2*nsam, -1, dtype=np.int32)
+    lineages[:n0] = np.arange(n0)
+    lineages[nsam:nsam + n1] = np.arange(n0, nsam)
+    lineages = buffer(lineages)
+    config = buffer(np.array([n0, n1]))
+    time = 0.0
+    total_n = nsam
+    # There are at least nsam - 1 events
+    block_size = max(nsam, 64)
+
+    while total_n > 1:
+        expo = buffer(rng.exponential(1., 2*block_size))
+        unif = buffer(rng.uniform(size=3*block_size))
+        if stats is not None:
+            stats.lap("draws")
+        total_n, time, nevents, nmig = _two_demes_events(
+            lineages, config, nsam, total_n, time, migrate,
+            expo, unif, node_times, populations, children)
+        if stats is not None:
+            stats.lap("events")
+            stats.events["migration"] += nmig
+        if total_n > 1 and nevents < block_size:
+            raise ValueError("the remaining lineages can never "
+                             "coalesce, because there is no migration")
+
+
+def simulate_two_demes(n0, n1, migrate, rng=None,
+                       num_replicates=None, tables=None,
+                       profile=False, compact=False):
+    """
+    Simulate a coalescent tree for a sample
+    from two demes connected by symmetric migration.
+
+    Time is scaled in units of 2N generations,
+    where N is the size of each deme.
+
+    Random numbers are drawn in blocks, and the
+    events are run by a loop that is compiled when
+    Numba is available (see :mod:`simbook.coalescent.backend`).
+    Either way, a given seed gives the same tree.
+
+    :param n0: The sample size in deme 0
+    :type n0: int
+    :param n1: The sample size in deme 1
+    :type n1: int
+    :param migrate: The per-lineage migration rate
+    :type migrate: float
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param num_replicates: If not ``None``, return a generator
+                           of this many replicates.
+    :type num_replicates: int
+    :param tables: A table collection to fill instead
+                   of allocating a new one.
+    :type tables: tskit.TableCollection
+    :param profile: If ``True``, also return a
+                    :class:`SimulationStats` with the
+                    number of events of each type and the
+                    time spent in each phase of the simulation.
+                    The phases are ``setup``, ``draws``
+                    (drawing blocks of random numbers),
+                    ``events`` (the compiled loop, which
+                    computes the rates, chooses the lineages,
+                    and writes the nodes and edges, all at
+                    once), and ``finalization``.
+    :type profile: bool
+    :param compact: If ``True``, return a
+                    :class:`simbook.coalescent.genealogy.Genealogy`
+                    instead of a tree sequence.
+    :type compact: bool
+    """
     if n0 < 0 or n1 < 0:
         raise ValueError("sample sizes must be >= 0")
     nsam = n0 + n1
     if nsam < 2:
         raise ValueError("total sample size must be > 1")
+    if num_replicates is not None:
+        return replicates(simulate_two_demes, num_replicates,
+                          n0, n1, migrate, rng=rng, profile=profile,
+                          compact=compact)
+    if rng is None:
+        rng = np.random
+    stats = SimulationStats() if profile else None
 
-    tc = tskit.TableCollection(1)
+    # The numbers of nodes and edges are known
+    # in advance, so we fill arrays and build
+    # the tables from them at the end.
+    node_times = buffer(np.zeros(2*nsam - 1))
+    flags = np.zeros(2*nsam - 1, dtype=np.uint32)
+    flags[:nsam] = tskit.NODE_IS_SAMPLE
+    populations = np.zeros(2*nsam - 1, dtype=np.int32)
+    populations[n0:nsam] = 1
+    populations = buffer(populations)
+    children = buffer(np.zeros(2*nsam - 2, dtype=np.int32))
 
-    for i in range(n0):
-        tc.nodes.add_row(time=0.0,
-                         flags=tskit.NODE_IS_SAMPLE, population=0)
-    for i in range(n1):
-        tc.nodes.add_row(time=0.0,
-                         flags=tskit.NODE_IS_SAMPLE, population=1)
-    for i in range(2):
-        tc.populations.add_row()
+    if stats is not None:
+        stats.lap("setup")
+    _run_two_demes(n0, n1, migrate, rng, node_times, populations,
+                   children, stats)
 
-    nodes = np.arange(2*nsam - 1, dtype=np.int32)
-    time = 0.0
-    total_n = nsam
-    config = np.array([n0, n1], dtype=np.int32)
-    current_demes = np.array([-1] * len(nodes), dtype=np.int32)
-    current_demes[:n0] = 0
-    current_demes[n0:nsam] = 1
+    parents = np.repeat(np.arange(nsam, 2*nsam - 1, dtype=np.int32), 2)
+    node_times = np.asarray(node_times)
+    children = np.asarray(children, dtype=np.int32)
+    populations = np.asarray(populations, dtype=np.int32)
+    if compact:
+        ts = Genealogy.from_edges(node_times, parents, children, nsam,
+                                  populations, 2)
+    else:
+        tc = build_tables(node_times, flags, parents, children,
+                          population=populations,
+                          num_populations=2, tables=tables)
+        ts = tc.tree_sequence()
+    if stats is not None:
+        stats.events["coalescence"] += nsam - 1
+        stats.lap("finalization")
+        return ts, stats
+    return ts
 
-    while total_n > 1:
-        tcoal, tmig, rcoal0, rcoal1 = _get_rates(config, migrate)
 
-        if tmig < tcoal:
-            time += tmig
-            source, dest = _pick_migrant(config)
-            idx = np.where(current_demes == source)[0]
-            p = np.random.choice(len(idx), 1)[0]
-            current_demes[idx[p]] = dest
-            config[source] -= 1
-            config[dest] += 1
-        else:
-            time += tcoal
-            if np.random.uniform() < rcoal0/(rcoal0 + rcoal1):
-                deme = 0
-            else:
-                deme = 1
-            tc.nodes.add_row(time=time, flags=0, population=deme)
-            ancestor = 2*nsam - total_n
-            idx = np.where(current_demes == deme)[0]
-            p = np.random.choice(len(idx), 1)[0]
-            c1 = nodes[idx[p]]
-            assert current_demes[idx[p]] == deme
-            nodes[idx[p]] = nodes[idx[-1]]
-            current_demes[idx[-1]] = -1
-            p = np.random.choice(len(idx)-1, 1)[0]
-            assert current_demes[idx[p]] == deme
-            c2 = nodes[idx[p]]
-            nodes[idx[p]] = ancestor
-            if c1 > c2:
-                c1, c2 = c2, c1
-            tc.edges.add_row(parent=ancestor, child=c1,
-                             left=0.0, right=1.0)
-            tc.edges.add_row(parent=ancestor, child=c2,
-                             left=0.0, right=1.0)
-            config[deme] -= 1
-            total_n -= 1
-    return tc.tree_sequence()
+@jit
+def _f2_branch(x0, x1, n0, n1):
+    """
+    The contribution to the branch-mode f2 statistic
+    of a unit length of branch above x0 of the n0
+    samples from deme 0 and x1 of the n1 samples
+    from deme 1.  This is the summary function that
+    tskit uses for ``TreeSequence.f2``.
+    """
+    y0 = n0 - x0
+    y1 = n1 - x1
+    numer = (x0*(x0-1)*y1*(y1-1) + y0*(y0-1)*x1*(x1-1)
+             - 2*x0*y0*x1*y1)
+    return numer/(n0*(n0-1)*n1*(n1-1))
+
+
+@jit
+def _tree_summaries(node_times, children, n0, n1, below0, below1):
+    """
+    Return the TMRCA, TTOT, and branch-mode f2 of a
+    tree from :func:`_run_two_demes`.  ``below0`` and
+    ``below1`` count the samples from each deme below
+    each node, and their ancestors' entries are
+    overwritten.
+    """
+    nsam = n0 + n1
+    ttot = 0.0
+    f2 = 0.0
+    # Ancestors are numbered in order of time, so
+    # their children's counts are always final.
+    for i in range(nsam - 1):
+        ancestor = nsam + i
+        t = node_times[ancestor]
+        x0 = 0
+        x1 = 0
+        for j in range(2):
+            c = children[2*i + j]
+            length = t - node_times[c]
+            ttot += length
+            if n0 > 1 and n1 > 1:
+                f2 += length*_f2_branch(below0[c], below1[c], n0, n1)
+            x0 += below0[c]
+            x1 += below1[c]
+        below0[ancestor] = x0
+        below1[ancestor] = x1
+    return node_times[2*nsam - 2], ttot, f2
+
+
+def simulate_two_demes_summaries(n0, n1, migrate, num_replicates,
+                                 rng=None):
+    """
+    Return summaries of many replicates of
+    :func:`simulate_two_demes` without building
+    any trees.
+
+    Each replicate is simulated exactly as by
+    :func:`simulate_two_demes`, with the same random
+    numbers, into node and edge arrays that are reused
+    from one replicate to the next.  The summaries are
+    then computed from those arrays, counting the samples
+    from each deme below each node as we go, which is all
+    that the branch-mode f2 statistic needs.
+
+    The f2 statistic compares the samples from deme 0
+    with those from deme 1, matching
+    ``ts.f2(samples, mode="branch")``.  It is undefined
+    (NaN) unless both demes have at least two samples.
+
+    :param n0: The sample size in deme 0
+    :type n0: int
+    :param n1: The sample size in deme 1
+    :type n1: int
+    :param migrate: The per-lineage migration rate
+    :type migrate: float
+    :param num_replicates: The number of replicates
+    :type num_replicates: int
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+
+    :returns: TMRCA, TTOT, and f2, each of length ``num_replicates``
+    :rtype: tuple
+    """
+    if n0 < 0 or n1 < 0:
+        raise ValueError("sample sizes must be >= 0")
+    nsam = n0 + n1
+    if nsam < 2:
+        raise ValueError("total sample size must be > 1")
+    if num_replicates < 0:
+        raise ValueError("number of replicates must be >= 0")
+    if rng is None:
+        rng = np.random
+
+    tmrca = np.zeros(num_replicates)
+    ttot = np.zeros(num_replicates)
+    f2 = np.zeros(num_replicates)
+
+    # Per-node state, reused across replicates.
+    # Only the ancestors' entries change.
+    node_times = buffer(np.zeros(2*nsam - 1))
+    populations = np.zeros(2*nsam - 1, dtype=np.int32)
+    populations[n0:nsam] = 1
+    populations = buffer(populations)
+    children = buffer(np.zeros(2*nsam - 2, dtype=np.int32))
+    below0 = np.zeros(2*nsam - 1, dtype=np.int64)
+    below0[:n0] = 1
+    below0 = buffer(below0)
+    below1 = np.zeros(2*nsam - 1, dtype=np.int64)
+    below1[n0:nsam] = 1
+    below1 = buffer(below1)
+
+    for r in range(num_replicates):
+        _run_two_demes(n0, n1, migrate, rng, node_times, populations,
+                       children)
+        tmrca[r], ttot[r], f2[r] = _tree_summaries(
+            node_times, children, n0, n1, below0, below1)
+    if n0 < 2 or n1 < 2:
+        f2[:] = np.nan
+    return tmrca, ttot, f2
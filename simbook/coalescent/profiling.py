@@ -0,0 +1,44 @@
+import collections
+import time
+
+
+class SimulationStats(object):
+    """
+    Event counts and time spent in each phase
+    of a simulation.
+
+    The simulators call :meth:`lap` at the end of
+    each phase, which adds the time since the previous
+    call to that phase's total.
+
+    :ivar events: The number of events of each type
+    :vartype events: collections.Counter
+    :ivar times: The time, in seconds, spent in each phase
+    :vartype times: dict
+    """
+
+    def __init__(self):
+        self.events = collections.Counter()
+        self.times = collections.defaultdict(float)
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.times[phase] += now - self._last
+        self._last = now
+
+    def per_second(self, event):
+        """
+        The number of events of a type per second
+        of total simulation time.
+        """
+        total = sum(self.times.values())
+        return self.events[event]/total if total > 0. else 0.
+
+    def __str__(self):
+        total = sum(self.times.values())
+        lines = ["{}: {}".format(k, v) for k, v in self.events.items()]
+        for k, v in self.times.items():
+            lines.append("{}: {:.6f} s ({:.1%})".format(
+                k, v, v/total if total > 0. else 0.))
+        return "\n".join(lines)
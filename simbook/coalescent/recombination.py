@@ -0,0 +1,345 @@
+import bisect
+
+import numpy as np
+import tskit
+from simbook.tables import build_tables
+from simbook.coalescent.fenwick import FenwickTree
+from simbook.coalescent.replicates import replicates
+
+
+class _Segment(object):
+    """
+    A genomic interval of ancestral material carried
+    by a lineage.  The segments of a lineage form a
+    doubly-linked list in left to right order, and the
+    lineage is represented by the first segment.
+    """
+
+    __slots__ = ("left", "right", "node", "prev", "next", "index")
+
+    def __init__(self, left, right, node, index):
+        self.left = left
+        self.right = right
+        self.node = node
+        self.prev = None
+        self.next = None
+        self.index = index
+
+
+class _Simulation(object):
+    """
+    The state of :func:`simulate`.
+
+    Each segment has a slot in a Fenwick tree, whose value
+    is the length of genome over which a recombination
+    would split the lineage between that segment and the
+    one before it.  For the first segment of a lineage,
+    this is its own length.  For the others, it also
+    includes the gap since the previous segment.  The
+    total is the length over which recombinations are
+    possible, summed over lineages.
+
+    The number of lineages carrying ancestral material at
+    each position is stored as a sorted list of
+    breakpoints and the count to the right of each.
+    Positions where the count falls to one have found
+    their most recent common ancestor, and their material
+    is no longer followed.
+    """
+
+    def __init__(self, nsam, sequence_length):
+        self.mass = FenwickTree(max(2*nsam, 64))
+        # The segment in each slot of the Fenwick
+        # tree, and the slots that are not in use
+        self.segments = [None]*len(self.mass)
+        self.free = list(range(len(self.mass) - 1, -1, -1))
+        self.lineages = []
+        for node in range(nsam):
+            seg = self.alloc_segment(0.0, sequence_length, node)
+            self.set_mass(seg)
+            self.lineages.append(seg)
+        self.breakpoints = [0.0, sequence_length]
+        self.counts = [nsam, -1]
+        self.node_times = [0.0]*nsam
+        self.edge_left = []
+        self.edge_right = []
+        self.edge_parent = []
+        self.edge_child = []
+
+    def alloc_segment(self, left, right, node):
+        if len(self.free) == 0:
+            # Double the capacity of the Fenwick tree
+            old = self.mass
+            self.mass = FenwickTree(2*len(old))
+            for i in range(len(old)):
+                if old[i] != 0.:
+                    self.mass[i] = old[i]
+            self.free = list(range(len(self.mass) - 1, len(old) - 1, -1))
+            self.segments.extend([None]*len(old))
+        seg = _Segment(left, right, node, self.free.pop())
+        self.segments[seg.index] = seg
+        return seg
+
+    def free_segment(self, seg):
+        self.mass[seg.index] = 0.
+        self.segments[seg.index] = None
+        self.free.append(seg.index)
+
+    def set_mass(self, seg):
+        if seg.prev is None:
+            mass = seg.right - seg.left
+        else:
+            mass = seg.right - seg.prev.right
+        # Most segments keep their mass when chains
+        # are merged, so skip the O(log n) update.
+        if self.mass[seg.index] != mass:
+            self.mass[seg.index] = mass
+
+    def _breakpoint(self, x):
+        """
+        Add a breakpoint at x, if there is not one
+        already, and return its index.
+        """
+        i = bisect.bisect_left(self.breakpoints, x)
+        if self.breakpoints[i] != x:
+            self.breakpoints.insert(i, x)
+            self.counts.insert(i, self.counts[i-1])
+        return i
+
+    def recombination_event(self, rng):
+        total = self.mass.total()
+        while True:
+            h = rng.uniform()*total
+            i = self.mass.find(h)
+            if self.mass[i] == 0.:
+                continue
+            y = self.segments[i]
+            k = y.right - (self.mass.prefix_sum(i + 1) - h)
+            x = y.prev
+            # Rounding error can put the breakpoint at
+            # the edge of the interval, which would leave
+            # one of the two lineages without material.
+            start = y.left if x is None else x.right
+            if start < k < y.right:
+                break
+
+        if y.left < k:
+            # Split y in two
+            z = self.alloc_segment(k, y.right, y.node)
+            z.next = y.next
+            if y.next is not None:
+                y.next.prev = z
+            y.next = None
+            y.right = k
+            self.set_mass(y)
+        else:
+            # The breakpoint is in the gap between x and y
+            x.next = None
+            y.prev = None
+            z = y
+        self.set_mass(z)
+        self.lineages.append(z)
+
+    def common_ancestor_event(self, time, rng):
+        lineages = self.lineages
+        k = len(lineages)
+        p = int(rng.uniform()*k)
+        x = lineages[p]
+        lineages[p] = lineages[-1]
+        lineages.pop()
+        p = int(rng.uniform()*(k-1))
+        y = lineages[p]
+        lineages[p] = lineages[-1]
+        lineages.pop()
+        self.merge(x, y, time)
+
+    def merge(self, x, y, time):
+        """
+        Merge the segment chains of two lineages into
+        the chain of their common ancestor.  Where they
+        overlap, the ancestor is a new node.
+        """
+        z = None
+        v = -1
+        defrag = False
+        while x is not None or y is not None:
+            alpha = None
+            if x is None or y is None:
+                alpha = x if y is None else y
+                x = None
+                y = None
+            else:
+                if y.left < x.left:
+                    x, y = y, x
+                if x.right <= y.left:
+                    alpha = x
+                    x = x.next
+                    alpha.next = None
+                elif x.left != y.left:
+                    alpha = self.alloc_segment(x.left, y.left, x.node)
+                    x.left = y.left
+                else:
+                    if v < 0:
+                        v = len(self.node_times)
+                        self.node_times.append(time)
+                    left = x.left
+                    r_max = min(x.right, y.right)
+                    i = self._breakpoint(left)
+                    self._breakpoint(r_max)
+                    counts = self.counts
+                    if counts[i] == 2:
+                        # x and y are the last two lineages
+                        # here, so this is the MRCA
+                        counts[i] = 0
+                        right = self.breakpoints[i+1]
+                    else:
+                        while counts[i] != 2 and \
+                                self.breakpoints[i] < r_max:
+                            counts[i] -= 1
+                            i += 1
+                        right = self.breakpoints[i]
+                        alpha = self.alloc_segment(left, right, v)
+                    for child in (x.node, y.node):
+                        self.edge_left.append(left)
+                        self.edge_right.append(right)
+                        self.edge_parent.append(v)
+                        self.edge_child.append(child)
+                    if x.right == right:
+                        self.free_segment(x)
+                        x = x.next
+                    else:
+                        x.left = right
+                    if y.right == right:
+                        self.free_segment(y)
+                        y = y.next
+                    else:
+                        y.left = right
+            if alpha is not None:
+                if z is None:
+                    self.lineages.append(alpha)
+                else:
+                    defrag |= z.right == alpha.left and \
+                        z.node == alpha.node
+                    z.next = alpha
+                alpha.prev = z
+                self.set_mass(alpha)
+                z = alpha
+        if defrag:
+            self.defrag_chain(z)
+
+    def defrag_chain(self, z):
+        """
+        Join adjacent segments of a chain that
+        belong to the same node.
+        """
+        y = z
+        while y.prev is not None:
+            x = y.prev
+            if x.right == y.left and x.node == y.node:
+                x.right = y.right
+                x.next = y.next
+                if y.next is not None:
+                    y.next.prev = x
+                self.set_mass(x)
+                self.free_segment(y)
+            y = x
+
+    def edges(self):
+        """
+        Return the edges, with adjacent intervals between
+        the same parent and child joined, in the order
+        that tskit requires.
+        """
+        left = np.array(self.edge_left)
+        right = np.array(self.edge_right)
+        parent = np.array(self.edge_parent, dtype=np.int32)
+        child = np.array(self.edge_child, dtype=np.int32)
+        # Parents are numbered in order of time, so
+        # this also sorts the edges by parent time.
+        order = np.lexsort((left, child, parent))
+        left = left[order]
+        right = right[order]
+        parent = parent[order]
+        child = child[order]
+        start = np.ones(len(left), dtype=bool)
+        start[1:] = (parent[1:] != parent[:-1]) | \
+            (child[1:] != child[:-1]) | (left[1:] != right[:-1])
+        end = np.ones(len(left), dtype=bool)
+        end[:-1] = start[1:]
+        return left[start], right[end], parent[start], child[start]
+
+
+def simulate(nsam: int, recombination_rate: float,
+             sequence_length: float = 1.0, rng=None,
+             num_replicates=None, tables=None):
+    """
+    Hudson's coalescent with recombination, producing
+    a tree sequence with one tree per genomic interval
+    that has its own history.
+
+    Time is scaled in units of 2N generations, and the
+    recombination rate is per unit of sequence length per
+    2N generations, so that a lineage carrying the whole
+    genome recombines at rate
+    ``recombination_rate*sequence_length``.
+
+    Each lineage is a linked list of the segments of
+    genome for which it carries ancestral material.  The
+    position of a recombination is chosen with a Fenwick
+    tree over the lengths of the segments and the gaps
+    between them, so each event takes logarithmic time
+    in the number of segments rather than a scan over
+    all lineages.  Material whose most recent common
+    ancestor has been found is dropped.  The edges are
+    built as we go, like those of :func:`hudson1990.simulate`,
+    and the tables are filled once at the end.
+
+    :param nsam: The sample size
+    :type nsam: int
+    :param recombination_rate: The rate of recombination per
+                               unit of sequence length
+    :type recombination_rate: float
+    :param sequence_length: The length of the genome
+    :type sequence_length: float
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param num_replicates: If not ``None``, return a generator
+                           of this many replicates.
+    :type num_replicates: int
+    :param tables: A table collection to fill instead
+                   of allocating a new one.
+    :type tables: tskit.TableCollection
+    """
+    if nsam < 2:
+        raise ValueError("sample size must be > 1")
+    if recombination_rate < 0:
+        raise ValueError("recombination rate must be >= 0")
+    if sequence_length <= 0:
+        raise ValueError("sequence length must be > 0")
+    if num_replicates is not None:
+        return replicates(simulate, num_replicates, nsam,
+                          recombination_rate, sequence_length, rng=rng)
+    if rng is None:
+        rng = np.random
+
+    sim = _Simulation(nsam, float(sequence_length))
+    time = 0.0
+    while len(sim.lineages) > 0:
+        k = len(sim.lineages)
+        rcoal = (k*(k-1))/2.
+        rrec = recombination_rate*sim.mass.total()
+        time += rng.exponential(1./(rcoal + rrec))
+        if rng.uniform()*(rcoal + rrec) < rrec:
+            sim.recombination_event(rng)
+        else:
+            sim.common_ancestor_event(time, rng)
+
+    left, right, parent, child = sim.edges()
+    node_times = np.array(sim.node_times)
+    flags = np.zeros(len(node_times), dtype=np.uint32)
+    flags[:nsam] = tskit.NODE_IS_SAMPLE
+    tc = build_tables(node_times, flags, parent, child,
+                      left=left, right=right,
+                      sequence_length=sequence_length, tables=tables)
+    return tc.tree_sequence()
@@ -0,0 +1,30 @@
+import tskit
+
+
+def replicates(simulator, num_replicates, *args, rng=None, **kwargs):
+    """
+    Lazily generate replicates of a simulation,
+    in the style of ``msprime.simulate(..., num_replicates=...)``.
+
+    A single table collection is cleared and refilled
+    for every replicate, rather than allocating a new one
+    each time.  Each replicate is only simulated when the
+    caller asks for it, so memory use does not grow with
+    the number of replicates.
+
+    The simulator is called as
+    ``simulator(*args, rng=rng, tables=tables, **kwargs)``.
+
+    :param simulator: The simulation function
+    :type simulator: callable
+    :param num_replicates: The number of replicates
+    :type num_replicates: int
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    """
+    if num_replicates < 0:
+        raise ValueError("number of replicates must be >= 0")
+    tables = tskit.TableCollection(1)
+    for i in range(num_replicates):
+        yield simulator(*args, rng=rng, tables=tables, **kwargs)
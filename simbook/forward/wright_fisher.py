@@ -0,0 +1,231 @@
+"""
+Forward-time simulation of a diploid Wright-Fisher
+population with tree sequence recording.
+"""
+import numpy as np
+import tskit
+from simbook.coalescent.profiling import SimulationStats
+
+
+class _EdgeBuffer(object):
+    """
+    Edges recorded since the last simplification,
+    in arrays that double in size when full.  The
+    edges of each generation are kept together.
+    """
+
+    def __init__(self, capacity):
+        self.left = np.empty(capacity)
+        self.right = np.empty(capacity)
+        self.parent = np.empty(capacity, dtype=np.int32)
+        self.child = np.empty(capacity, dtype=np.int32)
+        self.num_edges = 0
+        self.starts = []
+
+    def append(self, left, right, parent, child):
+        """
+        Add the edges of one generation.  They are
+        sorted by parent, and the children and left ends
+        must already be in order.
+        """
+        n = self.num_edges
+        m = n + len(child)
+        if m > len(self.child):
+            capacity = max(m, 2*len(self.child))
+            for name in ("left", "right", "parent", "child"):
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:n] = old[:n]
+                setattr(self, name, new)
+        # The keys are distinct, so a quicksort keeps
+        # the edges of each parent in order, and is
+        # faster than a stable sort.
+        key = parent.astype(np.int64)*len(child) + np.arange(len(child))
+        order = np.argsort(key)
+        self.left[n:m] = left[order]
+        self.right[n:m] = right[order]
+        self.parent[n:m] = parent[order]
+        self.child[n:m] = child[order]
+        self.starts.append(n)
+        self.num_edges = m
+
+    def flush(self, tables):
+        """
+        Add the edges to the edge table and empty the
+        buffer.
+
+        The parents of the buffered edges are younger than
+        those of the edges left by the last simplification,
+        so putting the generations first, latest first,
+        keeps the table sorted without calling
+        :meth:`tskit.TableCollection.sort`.
+        """
+        ends = self.starts[1:] + [self.num_edges]
+        columns = {}
+        for name in ("left", "right", "parent", "child"):
+            a = getattr(self, name)
+            columns[name] = np.concatenate(
+                [a[i:j] for i, j in zip(self.starts[::-1], ends[::-1])] +
+                [getattr(tables.edges, name)])
+        tables.edges.set_columns(**columns)
+        self.num_edges = 0
+        self.starts = []
+
+
+def _inherit(parents, offspring, recombination_rate, sequence_length, rng):
+    """
+    Draw the genome that each offspring genome inherits
+    from its parent, and return the edges.
+
+    ``parents`` holds the node of the first genome of
+    each offspring's parent, whose second genome is the
+    next node.  Crossovers happen as a Poisson process
+    along the genome, and the offspring switches between
+    the two parental genomes at each one.
+    """
+    n = len(offspring)
+    start = (rng.uniform(size=n) < 0.5).astype(np.int32)
+    if recombination_rate == 0.:
+        return (np.zeros(n), np.full(n, sequence_length),
+                parents + start, offspring)
+    nbreaks = rng.poisson(recombination_rate*sequence_length, size=n)
+    nedges = nbreaks + 1
+    total = int(nedges.sum())
+    owner = np.repeat(np.arange(n), nbreaks)
+    breaks = rng.uniform(size=len(owner))*sequence_length
+    # Sort the breakpoints of each genome, keeping
+    # the genomes in order.
+    breaks = breaks[np.lexsort((breaks, owner))]
+    first = np.cumsum(nedges) - nedges
+    last = first + nedges - 1
+    left = np.empty(total)
+    right = np.empty(total)
+    inner = np.ones(total, dtype=bool)
+    inner[first] = False
+    left[first] = 0.
+    left[inner] = breaks
+    inner[first] = True
+    inner[last] = False
+    right[last] = sequence_length
+    right[inner] = breaks
+    j = np.arange(total) - np.repeat(first, nedges)
+    genome = np.repeat(start, nedges) ^ (j & 1)
+    return (left, right, np.repeat(parents, nedges) + genome,
+            np.repeat(offspring, nedges))
+
+
+def simulate(N: int, num_generations: int, rng=None,
+             recombination_rate=0., sequence_length=1.0,
+             simplify_interval=100, profile=False):
+    """
+    A diploid Wright-Fisher population of constant
+    size, simulated forwards in time for a number of
+    generations with tree sequence recording.
+
+    Each generation, every one of the ``N`` offspring
+    picks two parents at random, with replacement, and
+    inherits one genome from each.  The parents of all
+    ``2N`` offspring genomes are drawn at once, and the
+    edges from each parental genome to the part of the
+    offspring genome that it passes on are stored in a
+    buffer.  Every ``simplify_interval`` generations the
+    buffer is added to the tables in one call, in an order
+    that keeps them sorted, and the tables are simplified
+    with the current generation as the samples.  Only the
+    ancestors of the living genomes are kept, so memory
+    grows with the interval rather than with the number
+    of generations.
+
+    Node times are in generations before the end of the
+    simulation.  The genomes of the first generation have
+    no ancestors, so the trees may have several roots if
+    ``num_generations`` is small compared to ``2N``.
+
+    :param N: The number of diploid individuals
+    :type N: int
+    :param num_generations: The number of generations
+    :type num_generations: int
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    :param recombination_rate: The expected number of
+                               crossovers per unit of sequence
+                               length per generation
+    :type recombination_rate: float
+    :param sequence_length: The length of the genome
+    :type sequence_length: float
+    :param simplify_interval: The number of generations
+                              between simplifications
+    :type simplify_interval: int
+    :param profile: If ``True``, also return a
+                    :class:`SimulationStats` with the
+                    number of generations and edges and the
+                    time spent in each phase of the simulation.
+                    ``stats.per_second("individuals")`` is
+                    the number of generations per second
+                    times ``N``, which measures throughput
+                    independently of the population size.
+    :type profile: bool
+    """
+    if N < 1:
+        raise ValueError("population size must be > 0")
+    if num_generations < 0:
+        raise ValueError("number of generations must be >= 0")
+    if simplify_interval < 1:
+        raise ValueError("simplify interval must be > 0")
+    if recombination_rate < 0:
+        raise ValueError("recombination rate must be >= 0")
+    if sequence_length <= 0:
+        raise ValueError("sequence length must be > 0")
+    if rng is None:
+        rng = np.random
+    stats = SimulationStats() if profile else None
+
+    tables = tskit.TableCollection(sequence_length=sequence_length)
+    flags = np.zeros(2*N, dtype=np.uint32)
+    tables.nodes.append_columns(flags=flags,
+                                time=np.full(2*N, float(num_generations)))
+    buf = _EdgeBuffer(2*N*min(simplify_interval, max(num_generations, 1)))
+    # The first node of the living generation
+    alive = 0
+    if stats is not None:
+        stats.lap("setup")
+
+    for g in range(1, num_generations + 1):
+        parents = alive + 2*(rng.uniform(size=2*N)*N).astype(np.int32)
+        offspring = np.arange(tables.nodes.num_rows,
+                              tables.nodes.num_rows + 2*N, dtype=np.int32)
+        edges = _inherit(parents, offspring, recombination_rate,
+                         sequence_length, rng)
+        if stats is not None:
+            stats.lap("reproduction")
+
+        alive = tables.nodes.num_rows
+        tables.nodes.append_columns(
+            flags=flags, time=np.full(2*N, float(num_generations - g)))
+        buf.append(*edges)
+        if stats is not None:
+            stats.lap("recording")
+            stats.events["edges"] += len(edges[3])
+
+        if g % simplify_interval == 0 or g == num_generations:
+            buf.flush(tables)
+            # The samples are renumbered from zero,
+            # in the order given.
+            tables.simplify(np.arange(alive, alive + 2*N, dtype=np.int32))
+            alive = 0
+            if stats is not None:
+                stats.lap("simplification")
+                stats.events["simplifications"] += 1
+
+    if stats is not None:
+        stats.events["generations"] += num_generations
+        stats.events["individuals"] += N*num_generations
+    if num_generations == 0:
+        tables.nodes.flags = np.full(2*N, tskit.NODE_IS_SAMPLE,
+                                     dtype=np.uint32)
+    ts = tables.tree_sequence()
+    if stats is not None:
+        stats.lap("finalization")
+        return ts, stats
+    return ts
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def place_mutations(tables, theta, rng=None):
+    """
+    Add neutral mutations under the infinitely-many
+    sites model to a table collection.
+
+    Time is assumed to be in units of 2N generations,
+    so that the mutation rate along a branch is
+    :math:`\\theta/2` per unit time over the whole genome.
+    The number of mutations on every edge is drawn with
+    one vectorized Poisson call, and the mutations are
+    placed uniformly along the genomic interval and the
+    branch of their edge.  Every mutation gets its own site,
+    with ancestral state ``"0"`` and derived state ``"1"``.
+
+    Any existing sites and mutations are removed.
+
+    :param tables: The table collection to modify
+    :type tables: tskit.TableCollection
+    :param theta: The population-scaled mutation rate, 4Nu
+    :type theta: float
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+    """
+    if theta < 0:
+        raise ValueError("theta must be >= 0")
+    if rng is None:
+        rng = np.random
+
+    node_times = tables.nodes.time
+    left = tables.edges.left
+    right = tables.edges.right
+    parent = tables.edges.parent
+    child = tables.edges.child
+    span = right - left
+    tparent = node_times[parent]
+    tchild = node_times[child]
+
+    mean = 0.5*theta*(tparent - tchild)*span/tables.sequence_length
+    counts = rng.poisson(mean)
+    edge = np.repeat(np.arange(len(counts)), counts)
+    nmuts = len(edge)
+
+    position = left[edge] + rng.uniform(size=nmuts)*span[edge]
+    time = tchild[edge] + \
+        rng.uniform(size=nmuts)*(tparent[edge] - tchild[edge])
+    order = np.argsort(position, kind="stable")
+    position = position[order]
+    time = time[order]
+    node = child[edge][order]
+
+    one_char = np.arange(nmuts + 1, dtype=np.uint32)
+    tables.sites.set_columns(
+        position=position,
+        ancestral_state=np.full(nmuts, ord("0"), dtype=np.int8),
+        ancestral_state_offset=one_char)
+    tables.mutations.set_columns(
+        site=np.arange(nmuts, dtype=np.int32),
+        node=node,
+        time=time,
+        derived_state=np.full(nmuts, ord("1"), dtype=np.int8),
+        derived_state_offset=one_char)
+
+
+def mutate(ts, theta, rng=None):
+    """
+    Return a copy of a tree sequence with neutral
+    mutations added under the infinitely-many sites
+    model.  See :func:`place_mutations` for details.
+
+    :param ts: A tree sequence
+    :type ts: tskit.TreeSequence
+    :param theta: The population-scaled mutation rate, 4Nu
+    :type theta: float
+    :param rng: The source of random numbers.  If ``None``,
+                the global NumPy random state is used.
+    :type rng: numpy.random.Generator
+
+    :rtype: tskit.TreeSequence
+    """
+    tables = ts.dump_tables()
+    place_mutations(tables, theta, rng)
+    return tables.tree_sequence()
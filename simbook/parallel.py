@@ -0,0 +1,114 @@
+import multiprocessing
+
+import numpy as np
+
+
+def _run_chunk(task):
+    """
+    Run one chunk of replicates in a worker.
+    """
+    simulator, args, kwargs, summarise, num_replicates, seed = task
+    rng = np.random.default_rng(seed)
+    results = []
+    for i in range(num_replicates):
+        ts = simulator(*args, rng=rng, **kwargs)
+        if summarise is not None:
+            ts = summarise(ts)
+        results.append(ts)
+    return results
+
+
+def chunks(num_items, seed, chunk_size):
+    """
+    Split ``num_items`` into chunks of ``chunk_size``, the
+    last of which may be smaller, and return the size of
+    each chunk along with its own
+    :class:`numpy.random.SeedSequence`, spawned from ``seed``.
+
+    A worker that seeds a generator for each chunk gives
+    results that depend only on ``seed`` and ``chunk_size``,
+    and not on the number of workers.
+
+    :param num_items: The number of items
+    :type num_items: int
+    :param seed: The random number seed
+    :type seed: int
+    :param chunk_size: The number of items per chunk
+    :type chunk_size: int
+
+    :rtype: list
+    """
+    nchunks = (num_items + chunk_size - 1)//chunk_size
+    seeds = np.random.SeedSequence(seed).spawn(nchunks)
+    return [(min(chunk_size, num_items - i*chunk_size), s)
+            for i, s in enumerate(seeds)]
+
+
+def _tasks(simulator, args, kwargs, summarise,
+           num_replicates, seed, chunk_size):
+    for n, s in chunks(num_replicates, seed, chunk_size):
+        yield simulator, args, kwargs, summarise, n, s
+
+
+def run_replicates(simulator, num_replicates, seed,
+                   args=(), kwargs=None, summarise=None,
+                   num_workers=None, chunk_size=100):
+    """
+    Run replicates of a simulator in a pool of processes.
+
+    The replicates are split into chunks of ``chunk_size``.
+    Each chunk gets its own :class:`numpy.random.Generator`,
+    created from a :class:`numpy.random.SeedSequence` that is
+    spawned from ``seed``.  The results are yielded in
+    replicate order, so the output depends only on ``seed``
+    and ``chunk_size`` and not on the number of workers.
+
+    The simulator is called as
+    ``simulator(*args, rng=rng, **kwargs)``.
+    If ``summarise`` is given, it is applied to each
+    replicate in the worker, and its return value is
+    sent back instead of the simulation output.
+    Both functions must be picklable.
+
+    :param simulator: The simulation function
+    :type simulator: callable
+    :param num_replicates: The number of replicates
+    :type num_replicates: int
+    :param seed: The random number seed
+    :type seed: int
+    :param args: Positional arguments to the simulator
+    :type args: tuple
+    :param kwargs: Keyword arguments to the simulator
+    :type kwargs: dict
+    :param summarise: A function applied to each replicate
+    :type summarise: callable
+    :param num_workers: The number of processes.  If ``None``,
+                        the number of CPUs is used.  If 1, the
+                        replicates run in the calling process.
+    :type num_workers: int
+    :param chunk_size: The number of replicates per chunk
+    :type chunk_size: int
+    """
+    if num_replicates < 0:
+        raise ValueError("number of replicates must be >= 0")
+    if chunk_size < 1:
+        raise ValueError("chunk size must be > 0")
+    if num_workers is not None and num_workers < 1:
+        raise ValueError("number of workers must be > 0")
+    if kwargs is None:
+        kwargs = {}
+
+    tasks = _tasks(simulator, args, kwargs, summarise,
+                   num_replicates, seed, chunk_size)
+
+    if num_workers == 1:
+        for task in tasks:
+            yield from _run_chunk(task)
+        return
+
+    with multiprocessing.Pool(num_workers) as pool:
+        # imap returns chunks in the order they
+        # were submitted, whichever worker
+        # finishes first.
+        for results in pool.imap(_run_chunk, tasks):
+            yield from results
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+def allele_frequency_spectra(replicates, num_samples, num_replicates,
+                             mode="site", out=None):
+    """
+    Calculate the unfolded site frequency spectrum (SFS)
+    of each of a sequence of tree sequences.
+
+    The spectra are calculated from the tree structure by
+    tskit, rather than by decoding genotypes.  With
+    ``mode="site"``, entry ``i`` of a spectrum is the number
+    of mutations carried by ``i`` samples.  With
+    ``mode="branch"``, it is the total length of branches
+    with ``i`` samples below them, which is the expected
+    site spectrum divided by the mutation rate.
+
+    :param replicates: Tree sequences, such as the output of
+                       ``msprime.simulate(..., num_replicates=...)``
+    :type replicates: iterable
+    :param num_samples: The number of samples in each tree sequence
+    :type num_samples: int
+    :param num_replicates: The number of tree sequences
+    :type num_replicates: int
+    :param mode: ``"site"`` or ``"branch"``
+    :type mode: str
+    :param out: An array of shape
+                ``(num_replicates, num_samples + 1)``
+                in which to store the results
+    :type out: numpy.ndarray
+
+    :returns: The spectra, one row per replicate
+    :rtype: numpy.ndarray
+    """
+    if out is None:
+        out = np.zeros((num_replicates, num_samples + 1))
+    elif out.shape != (num_replicates, num_samples + 1):
+        raise ValueError("out must have shape "
+                         "(num_replicates, num_samples + 1)")
+    i = -1
+    for i, ts in enumerate(replicates):
+        if i >= num_replicates:
+            raise ValueError("more than num_replicates tree sequences")
+        out[i] = ts.allele_frequency_spectrum(mode=mode, polarised=True,
+                                              span_normalise=False)
+    if i + 1 != num_replicates:
+        raise ValueError("fewer than num_replicates tree sequences")
+    return out
+
+
+def branch_frequency_spectra(time, parent, child, out=None):
+    """
+    Calculate the branch-mode site frequency spectrum
+    of every replicate from the output of
+    :func:`simbook.coalescent.hudson1990.simulate_replicates`.
+
+    Because every replicate has its nodes and edges in
+    the same order, the number of samples below each node
+    is built up for all replicates at once, one coalescence
+    at a time, and branch lengths are added to the spectra
+    with a single call to :func:`numpy.add.at`.
+
+    :param time: Node times, one row per replicate
+    :type time: numpy.ndarray
+    :param parent: Edge parents, which are the same
+                   in every replicate
+    :type parent: numpy.ndarray
+    :param child: Edge children, one row per replicate
+    :type child: numpy.ndarray
+    :param out: An array of shape ``(num_replicates, nsam + 1)``
+                in which to accumulate the results
+    :type out: numpy.ndarray
+
+    :returns: The spectra, one row per replicate
+    :rtype: numpy.ndarray
+    """
+    nreps, nnodes = time.shape
+    nsam = (nnodes + 1)//2
+    if out is None:
+        out = np.zeros((nreps, nsam + 1))
+    elif out.shape != (nreps, nsam + 1):
+        raise ValueError("out must have shape (num_replicates, nsam + 1)")
+
+    rows = np.arange(nreps)[:, None]
+    below = np.zeros((nreps, nnodes), dtype=np.int64)
+    below[:, :nsam] = 1
+    for i in range(nsam - 1):
+        # Edges 2i and 2i + 1 connect the
+        # two children of node nsam + i
+        below[:, nsam + i] = below[rows[:, 0], child[:, 2*i]] + \
+            below[rows[:, 0], child[:, 2*i+1]]
+
+    length = time[rows, parent] - time[rows, child]
+    counts = below[rows, child]
+    np.add.at(out, (np.broadcast_to(rows, counts.shape), counts), length)
+    return out
+
+
+def singleton_proportion(sfs):
+    """
+    Return the fraction of each spectrum
+    made up by singletons.
+
+    :param sfs: Unfolded spectra, one row per replicate
+    :type sfs: numpy.ndarray
+
+    :rtype: numpy.ndarray
+    """
+    return sfs[:, 1]/sfs[:, 1:-1].sum(axis=1)
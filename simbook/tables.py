@@ -0,0 +1,61 @@
+import tskit
+import numpy as np
+
+
+def build_tables(time, flags, parent, child,
+                 population=None, num_populations=0,
+                 left=None, right=None,
+                 sequence_length=1.0, tables=None):
+    """
+    Create a table collection from node and edge columns.
+
+    Each table is filled by a single call to ``set_columns``
+    rather than one ``add_row`` per node or edge.
+    The edges must already be in the order required
+    by tskit.
+
+    If ``left`` and ``right`` are not given, every edge
+    spans the whole genome.
+
+    If ``tables`` is given, it is cleared and refilled
+    instead of allocating a new table collection.
+
+    :param time: Node times
+    :type time: numpy.ndarray
+    :param flags: Node flags
+    :type flags: numpy.ndarray
+    :param parent: Edge parents
+    :type parent: numpy.ndarray
+    :param child: Edge children
+    :type child: numpy.ndarray
+    :param population: Node populations
+    :type population: numpy.ndarray
+    :param num_populations: The number of rows in the population table
+    :type num_populations: int
+    :param left: Edge left coordinates
+    :type left: numpy.ndarray
+    :param right: Edge right coordinates
+    :type right: numpy.ndarray
+    :param sequence_length: The genome length
+    :type sequence_length: float
+    :param tables: An existing table collection to reuse
+    :type tables: tskit.TableCollection
+
+    :rtype: tskit.TableCollection
+    """
+    if tables is None:
+        tc = tskit.TableCollection(sequence_length)
+    else:
+        tc = tables
+        tc.clear()
+        tc.sequence_length = sequence_length
+    tc.nodes.set_columns(time=time, flags=flags, population=population)
+    if left is None:
+        left = np.zeros(len(parent))
+    if right is None:
+        right = np.full(len(parent), sequence_length)
+    tc.edges.set_columns(left=left, right=right,
+                         parent=parent, child=child)
+    for i in range(num_populations):
+        tc.populations.add_row()
+    return tc
@@ -0,0 +1,353 @@
+"""
+Training data for supervised machine learning on
+simulated genealogies.
+
+Replicates are simulated in a pool of processes, and
+fixed-shape features of each replicate are written to
+shards of ``.npy`` files that can be memory-mapped.  An
+``index.json`` file records the features, their shapes,
+and the shards.  :class:`TrainingData` reads the shards
+back without copying.
+"""
+import json
+import multiprocessing
+import os
+import pathlib
+
+import numpy as np
+
+from simbook.mutations import mutate
+from simbook.parallel import chunks
+
+FEATURES = ("genotypes", "positions", "num_sites", "sfs",
+            "coalescence_times")
+
+
+def msprime_simulator(rng, **kwargs):
+    """
+    Run ``msprime.simulate(**kwargs)`` with a seed drawn
+    from ``rng``, so that msprime can be used as the
+    simulator of :func:`generate`.
+    """
+    import msprime
+    return msprime.simulate(random_seed=int(rng.integers(1, 2**31)),
+                            **kwargs)
+
+
+def coalescence_times(ts):
+    """
+    Return the matrix of pairwise coalescence times
+    of the samples, averaged along the genome.
+
+    Samples are at time zero, so the branch-mode
+    divergence between two samples is twice the time
+    to their common ancestor.
+
+    :param ts: A tree sequence
+    :type ts: tskit.TreeSequence
+
+    :rtype: numpy.ndarray
+    """
+    n = ts.num_samples
+    i, j = np.triu_indices(n, 1)
+    samples = ts.samples()
+    d = ts.divergence([[u] for u in samples],
+                      indexes=np.column_stack((i, j)), mode="branch")
+    out = np.zeros((n, n))
+    out[i, j] = d/2.
+    out[j, i] = d/2.
+    return out
+
+
+def _shapes(num_samples, max_sites):
+    """
+    The shape and type of each feature of one replicate.
+    """
+    return {"genotypes": ((num_samples, max_sites), np.int8),
+            "positions": ((max_sites,), np.float64),
+            "num_sites": ((), np.int32),
+            "sfs": ((num_samples + 1,), np.float64),
+            "coalescence_times": ((num_samples, num_samples),
+                                  np.float32)}
+
+
+def _fill(arrays, r, ts, features, max_sites):
+    """
+    Write the features of replicate ``r``.
+    Sites beyond the first ``max_sites`` are dropped,
+    and unused columns are left as zeros.
+    """
+    nsites = min(ts.num_sites, max_sites)
+    if "genotypes" in features and nsites > 0:
+        g = ts.genotype_matrix()
+        arrays["genotypes"][r, :, :nsites] = g[:nsites].T
+    if "positions" in features:
+        arrays["positions"][r, :nsites] = \
+            ts.tables.sites.position[:nsites]
+    if "num_sites" in features:
+        arrays["num_sites"][r] = ts.num_sites
+    if "sfs" in features:
+        arrays["sfs"][r] = ts.allele_frequency_spectrum(
+            mode="site", polarised=True, span_normalise=False)
+    if "coalescence_times" in features:
+        arrays["coalescence_times"][r] = coalescence_times(ts)
+
+
+def _first_cut(num_replicates, batch_size, rng):
+    """
+    Draw where the first full block of a shard starts,
+    among the offsets that leave no piece at either end
+    shorter than ``batch_size//2``.  If the shard itself
+    is that short, it is one piece.
+    """
+    shortest = batch_size//2
+    start = np.arange(min(batch_size, num_replicates + 1))
+    end = (num_replicates - start) % batch_size
+    ok = (((start == 0) | (start >= shortest)) &
+          ((end == 0) | (end >= shortest)))
+    start = start[ok]
+    if len(start) == 0:
+        return 0
+    return int(start[int(rng.uniform()*len(start))])
+
+
+def _shard_path(directory, shard, feature):
+    return os.path.join(directory, "shard{:05d}.{}.npy".format(shard,
+                                                               feature))
+
+
+def _write_shard(task):
+    """
+    Simulate one shard in a worker and write its
+    features.  Only the sample size is sent back.
+    """
+    (directory, shard, simulator, kwargs, theta, features,
+     max_sites, num_replicates, seed) = task
+    rng = np.random.default_rng(seed)
+    arrays = None
+    paths = {}
+    num_samples = None
+    for r in range(num_replicates):
+        ts = simulator(rng=rng, **kwargs)
+        if theta is not None:
+            ts = mutate(ts, theta, rng)
+        if arrays is None:
+            num_samples = ts.num_samples
+            shapes = _shapes(num_samples, max_sites)
+            arrays = {}
+            for f in features:
+                shape, dtype = shapes[f]
+                paths[f] = _shard_path(directory, shard, f)
+                # Write to a temporary name, so that an
+                # interrupted run leaves no partial shards.
+                arrays[f] = np.lib.format.open_memmap(
+                    paths[f] + ".tmp", mode="w+", dtype=dtype,
+                    shape=(num_replicates,) + shape)
+        elif ts.num_samples != num_samples:
+            raise ValueError("all replicates must have the "
+                             "same number of samples")
+        _fill(arrays, r, ts, features, max_sites)
+    for f in features:
+        arrays[f].flush()
+        del arrays[f]
+        os.replace(paths[f] + ".tmp", paths[f])
+    return num_samples
+
+
+def generate(directory, simulator, num_replicates, seed, theta=None,
+             kwargs=None, features=FEATURES, max_sites=256,
+             shard_size=1000, num_workers=None):
+    """
+    Simulate replicates and write their features to
+    sharded ``.npy`` files in ``directory``.
+
+    Each shard holds ``shard_size`` replicates and is
+    simulated and written by one worker, with its own
+    random number generator spawned from ``seed`` by
+    :func:`simbook.parallel.chunks`, so the output does not
+    depend on the number of workers.
+    The simulator is called as ``simulator(rng=rng, **kwargs)``
+    and must return a tree sequence; see
+    :func:`msprime_simulator` for msprime.  If ``theta`` is
+    given, mutations are added with
+    :func:`simbook.mutations.mutate`.
+
+    The features of each replicate are:
+
+    * ``genotypes``: the sample by site genotype matrix
+      of the first ``max_sites`` sites, padded with zeros
+    * ``positions``: the positions of those sites,
+      padded with zeros
+    * ``num_sites``: the number of sites before truncation
+    * ``sfs``: the unfolded site frequency spectrum
+    * ``coalescence_times``: the matrix of pairwise
+      coalescence times, as :func:`coalescence_times`
+
+    :param directory: Where to write the shards and index
+    :type directory: str
+    :param simulator: The simulation function
+    :type simulator: callable
+    :param num_replicates: The number of replicates
+    :type num_replicates: int
+    :param seed: The random number seed
+    :type seed: int
+    :param theta: The population-scaled mutation rate, 4Nu
+    :type theta: float
+    :param kwargs: Keyword arguments to the simulator
+    :type kwargs: dict
+    :param features: The names of the features to write
+    :type features: tuple
+    :param max_sites: The number of sites in the genotype features
+    :type max_sites: int
+    :param shard_size: The number of replicates per shard
+    :type shard_size: int
+    :param num_workers: The number of processes.  If ``None``,
+                        the number of CPUs is used.  If 1, the
+                        replicates run in the calling process.
+    :type num_workers: int
+
+    :returns: The loaded data set
+    :rtype: TrainingData
+    """
+    if num_replicates < 1:
+        raise ValueError("number of replicates must be > 0")
+    if shard_size < 1:
+        raise ValueError("shard size must be > 0")
+    if max_sites < 0:
+        raise ValueError("max_sites must be >= 0")
+    if num_workers is not None and num_workers < 1:
+        raise ValueError("number of workers must be > 0")
+    features = list(features)
+    for f in features:
+        if f not in FEATURES:
+            raise ValueError("unknown feature {}".format(f))
+    if kwargs is None:
+        kwargs = {}
+    os.makedirs(directory, exist_ok=True)
+
+    shards = chunks(num_replicates, seed, shard_size)
+    sizes = [n for n, s in shards]
+    tasks = [(directory, i, simulator, kwargs, theta, features,
+              max_sites, n, s) for i, (n, s) in enumerate(shards)]
+    if num_workers == 1:
+        num_samples = [_write_shard(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(num_workers) as pool:
+            num_samples = pool.map(_write_shard, tasks)
+    if len(set(num_samples)) != 1:
+        raise ValueError("all replicates must have the "
+                         "same number of samples")
+
+    shapes = _shapes(num_samples[0], max_sites)
+    index = {"num_replicates": num_replicates,
+             "num_samples": num_samples[0],
+             "seed": seed,
+             "features": {f: {"shape": list(shapes[f][0]),
+                              "dtype": np.dtype(shapes[f][1]).str}
+                          for f in features},
+             "shards": [{"prefix": "shard{:05d}".format(i),
+                         "num_replicates": n}
+                        for i, n in enumerate(sizes)]}
+    with open(os.path.join(directory, "index.json"), "w") as f:
+        json.dump(index, f, indent=1)
+    return TrainingData(directory)
+
+
+class TrainingData(object):
+    """
+    A data set written by :func:`generate`.
+
+    Every shard is memory-mapped read-only, so opening
+    a data set reads only the index, and the data are
+    paged in from disk as they are used.
+
+    :param directory: The directory holding ``index.json``
+    :type directory: str
+    """
+
+    def __init__(self, directory):
+        directory = pathlib.Path(directory)
+        with open(directory / "index.json") as f:
+            self.index = json.load(f)
+        self.features = list(self.index["features"])
+        self.shards = []
+        for shard in self.index["shards"]:
+            self.shards.append(
+                {f: np.load(directory / "{}.{}.npy".format(
+                    shard["prefix"], f), mmap_mode="r")
+                 for f in self.features})
+        sizes = [s["num_replicates"] for s in self.index["shards"]]
+        self.offsets = np.concatenate(([0], np.cumsum(sizes)))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _locate(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError("replicate {} does not exist".format(i))
+        shard = int(np.searchsorted(self.offsets, i, side="right")) - 1
+        return shard, i - int(self.offsets[shard])
+
+    def __getitem__(self, i):
+        """
+        Return the features of replicate ``i``, by name.
+        """
+        shard, j = self._locate(i)
+        return {f: a[j] for f, a in self.shards[shard].items()}
+
+    def batch(self, start, size):
+        """
+        Return the features of replicates ``start``
+        to ``start + size - 1``, by name.  The arrays are
+        views of the memory-mapped files, so the batch
+        must not cross a shard boundary.
+        """
+        shard, j = self._locate(start)
+        if j + size > self.index["shards"][shard]["num_replicates"]:
+            raise ValueError("a batch cannot cross a shard boundary")
+        return {f: a[j:j+size] for f, a in self.shards[shard].items()}
+
+    def minibatches(self, batch_size, rng=None, drop_last=False):
+        """
+        Yield the data set as minibatches of up to
+        ``batch_size`` replicates, in random order, without
+        copying.
+
+        The replicates are independent, so a block of
+        consecutive replicates is as random a sample as any
+        other.  Each shard is cut into blocks at a random
+        offset, drawn again on every call, so that the
+        blocks differ from one epoch to the next.  The
+        pieces at the start and end of a shard may be
+        shorter than ``batch_size``, so that every replicate
+        is yielded exactly once, but the offset is chosen so
+        that they hold at least ``batch_size//2`` replicates,
+        unless the whole shard is smaller than that.  The
+        blocks of all shards are shuffled.
+
+        :param batch_size: The number of replicates per batch
+        :type batch_size: int
+        :param rng: The source of random numbers.  If ``None``,
+                    the global NumPy random state is used.
+        :type rng: numpy.random.Generator
+        :param drop_last: If ``True``, skip the batches that are
+                          shorter than ``batch_size``.  Which
+                          replicates are skipped changes with
+                          the offsets.
+        :type drop_last: bool
+        """
+        if batch_size < 1:
+            raise ValueError("batch size must be > 0")
+        if rng is None:
+            rng = np.random
+        blocks = []
+        for shard in range(len(self.shards)):
+            n = self.index["shards"][shard]["num_replicates"]
+            offset = int(self.offsets[shard])
+            start = _first_cut(n, batch_size, rng)
+            cuts = [0] + list(range(start, n, batch_size)) + [n]
+            for i, j in zip(cuts[:-1], cuts[1:]):
+                if j > i and (j - i == batch_size or not drop_last):
+                    blocks.append((offset + i, j - i))
+        for k in rng.permutation(len(blocks)):
+            yield self.batch(*blocks[k])
@@ -0,0 +1,106 @@
+import numpy as np
+
+
+def index_edge_table(ts):
+    """
+    Return the insertion and removal orders of the
+    edges of a tree sequence.
+
+    The insertion order sorts edges by increasing left
+    position, parent time, parent, and child.  The removal
+    order sorts edges by increasing right position and
+    decreasing parent time, parent, and child.
+
+    Each order is an array of edge indexes, obtained with
+    :func:`numpy.lexsort` over the edge and node columns,
+    so no objects are created per edge.
+
+    :param ts: A tree sequence
+    :type ts: tskit.TreeSequence
+
+    :returns: The insertion and removal orders
+    :rtype: tuple
+    """
+    tables = ts.tables
+    return _index_edges(tables.edges.left, tables.edges.right,
+                        tables.edges.parent, tables.edges.child,
+                        tables.nodes.time)
+
+
+def _index_edges(left, right, parent, child, node_times):
+    ptime = node_times[parent]
+    # lexsort uses the last key as the primary key
+    inorder = np.lexsort((child, parent, ptime, left))
+    outorder = np.lexsort((-child, -parent, -ptime, right))
+    return inorder, outorder
+
+
+def edge_diffs(tables):
+    """
+    For each tree, yield its left and right coordinates,
+    followed by the parents and children of the edges
+    leaving and then entering the tree, in removal
+    and insertion order, respectively.
+    """
+    left = tables.edges.left
+    right = tables.edges.right
+    parent = tables.edges.parent
+    child = tables.edges.child
+
+    inorder, outorder = _index_edges(left, right, parent,
+                                     child, tables.nodes.time)
+    in_pos = left[inorder]
+    in_parent = parent[inorder]
+    in_child = child[inorder]
+    out_pos = right[outorder]
+    out_parent = parent[outorder]
+    out_child = child[outorder]
+    maxpos = tables.sequence_length
+
+    # The trees are the intervals between consecutive
+    # distinct edge coordinates.  For each left coordinate,
+    # find how far along each index we must move.
+    breaks = np.unique(np.concatenate(([0.0, maxpos], in_pos, out_pos)))
+    in_stop = np.searchsorted(in_pos, breaks[:-1], side="right").tolist()
+    out_stop = np.searchsorted(out_pos, breaks[:-1], side="right").tolist()
+    breaks = breaks.tolist()
+
+    i, o = 0, 0
+    for j in range(len(breaks) - 1):
+        outgoing = out_parent[o:out_stop[j]], out_child[o:out_stop[j]]
+        incoming = in_parent[i:in_stop[j]], in_child[i:in_stop[j]]
+        o = out_stop[j]
+        i = in_stop[j]
+        yield breaks[j], breaks[j+1], outgoing, incoming
+
+
+def algT(ts):
+    """
+    A re-implementation of Algorithm T
+    from Kelleher et al (2016), PloS
+    Compuational Biology,
+    10.1371/journal.pcbi.1004842,
+    driven by integer index arrays.
+
+    For each tree, yields its left and right coordinates
+    and the array of node parents, where -1 means
+    that a node has no parent.  The same parent array
+    is updated in place as we move from tree to tree,
+    so callers must copy it if they need to keep it.
+
+    The edges that leave or enter the tree at each
+    position are found up front by binary search on
+    the sorted positions, and each batch is applied
+    with a single array assignment.
+
+    :param ts: A tree sequence
+    :type ts: tskit.TreeSequence
+    """
+    tables = ts.tables
+    parent = np.full(len(tables.nodes), -1, dtype=np.int32)
+    for left, right, outgoing, incoming in edge_diffs(tables):
+        # Remove parents from the tree
+        parent[outgoing[1]] = -1
+        # Add parents to the tree
+        parent[incoming[1]] = incoming[0]
+        yield left, right, parent
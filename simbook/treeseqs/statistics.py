@@ -0,0 +1,227 @@
+import numpy as np
+
+from simbook.coalescent.backend import jit, buffer
+from simbook.treeseqs.algT import edge_diffs
+
+
+class TreeStatistic(object):
+    """
+    Base class for statistics that are updated
+    incrementally as Algorithm T moves along
+    the genome.
+
+    The edges leaving a tree are passed to
+    :meth:`process_outgoing` as arrays of parents
+    and children, in removal order (decreasing parent
+    time), while the parent array still describes the
+    old tree.  The edges entering the next tree are
+    then passed to :meth:`process_incoming`, in insertion
+    order (increasing parent time), once the parent array
+    describes the new tree.
+    """
+
+    def start(self, node_times, samples, parent):
+        """
+        Called once before the traversal starts.
+
+        :param node_times: The node time column
+        :type node_times: numpy.ndarray
+        :param samples: The sample nodes
+        :type samples: numpy.ndarray
+        :param parent: The parent array, updated in place
+        :type parent: numpy.ndarray
+        """
+        self.node_times = node_times
+        self.parent = parent
+
+    def process_outgoing(self, parents, children):
+        pass
+
+    def process_incoming(self, parents, children):
+        pass
+
+    def get_result(self):
+        raise NotImplementedError
+
+
+class TotalTime(TreeStatistic):
+    """
+    The total time on each tree
+    (sum of branch lengths).
+    """
+
+    def start(self, node_times, samples, parent):
+        super().start(node_times, samples, parent)
+        self.ttime = 0.0
+
+    def process_outgoing(self, parents, children):
+        t = self.node_times
+        self.ttime -= (t[parents] - t[children]).sum()
+
+    def process_incoming(self, parents, children):
+        t = self.node_times
+        self.ttime += (t[parents] - t[children]).sum()
+
+    def get_result(self):
+        return self.ttime
+
+
+@jit
+def _remove_edges(parents, children, tree_parent, counts):
+    for i in range(len(children)):
+        c = children[i]
+        n = counts[c]
+        tree_parent[c] = -1
+        u = parents[i]
+        # Edges above no counted samples
+        # change no counts.
+        while n != 0 and u != -1:
+            counts[u] -= n
+            u = tree_parent[u]
+
+
+@jit
+def _insert_edges(parents, children, tree_parent, counts, node_times,
+                  target, mrca):
+    """
+    Insert edges, and return the youngest node whose
+    count reaches ``target`` along the way, or ``mrca``
+    if that node is younger.
+    """
+    for i in range(len(children)):
+        c = children[i]
+        n = counts[c]
+        tree_parent[c] = parents[i]
+        u = parents[i]
+        while n != 0 and u != -1:
+            counts[u] += n
+            if counts[u] == target and \
+                    (mrca == -1 or node_times[u] < node_times[mrca]):
+                mrca = u
+            u = tree_parent[u]
+    return mrca
+
+
+class SampleCounts(TreeStatistic):
+    """
+    The number of samples below each node
+    of each tree.
+
+    If ``sample_set`` is given, only those samples
+    are counted.  The result is the array of counts,
+    which is updated in place.
+
+    Each batch of edges is handled by a loop that is
+    compiled if Numba is installed (see
+    :mod:`simbook.coalescent.backend`).  The loop walks
+    from the parent of each edge to the root, and skips
+    edges above none of the counted samples.
+
+    :param sample_set: The samples to count
+    :type sample_set: list
+    """
+
+    def __init__(self, sample_set=None):
+        self.sample_set = sample_set
+
+    def start(self, node_times, samples, parent):
+        super().start(node_times, samples, parent)
+        if self.sample_set is not None:
+            samples = np.array(self.sample_set, dtype=np.int32)
+        self.counts = np.zeros(len(node_times), dtype=np.int32)
+        self.counts[samples] = 1
+        # Updating the counts requires walking up the
+        # tree after each edge is removed or inserted,
+        # so we keep our own copy of the parents,
+        # updated one edge at a time.
+        self.tree_parent = buffer(np.full(len(node_times), -1,
+                                          dtype=np.int32))
+        # A count that no node reaches, so that
+        # no MRCA is tracked
+        self.target = -1
+        self.mrca = -1
+
+    def process_outgoing(self, parents, children):
+        _remove_edges(parents, children, self.tree_parent, self.counts)
+
+    def process_incoming(self, parents, children):
+        mrca = self.mrca
+        if mrca != -1 and self.counts[mrca] != self.target:
+            mrca = -1
+        self.mrca = _insert_edges(parents, children, self.tree_parent,
+                                  self.counts, self.node_times,
+                                  self.target, mrca)
+
+    def get_result(self):
+        return self.counts
+
+
+class SampleSetTMRCA(SampleCounts):
+    """
+    The time to the most recent common ancestor
+    of a set of samples on each tree.  The result
+    is infinite if the samples do not all have a
+    common ancestor on a tree.
+
+    The MRCA is the youngest node above all of the
+    samples.  It is tracked as the edges change,
+    rather than found by scanning the nodes of every
+    tree.  After the edges leaving a tree are removed,
+    the previous MRCA is still above all of the samples
+    or it is not.  Inserting edges only raises counts,
+    so any other node that is above all of the samples
+    in the new tree, and younger than the previous MRCA,
+    has its count raised to the size of the sample set
+    by an inserted edge, which the insertion loop sees.
+
+    :param sample_set: The samples
+    :type sample_set: list
+    """
+
+    def __init__(self, sample_set):
+        super().__init__(sample_set)
+
+    def start(self, node_times, samples, parent):
+        super().start(node_times, samples, parent)
+        self.target = len(self.sample_set)
+        if self.target == 1:
+            self.mrca = int(self.sample_set[0])
+
+    def get_result(self):
+        if self.mrca == -1:
+            return np.inf
+        return self.node_times[self.mrca]
+
+
+def custom_quantities(ts, statistics):
+    """
+    Calculate several statistics in a single
+    pass along a tree sequence.
+
+    The node columns are read once, and each
+    statistic is updated with arrays of the edges
+    that leave and enter the tree at each position.
+
+    For each tree, yields its left and right coordinates
+    and the list of the statistics' results.
+
+    :param ts: A tree sequence
+    :type ts: tskit.TreeSequence
+    :param statistics: The statistics to calculate
+    :type statistics: list
+    """
+    tables = ts.tables
+    node_times = tables.nodes.time
+    samples = ts.samples()
+    parent = np.full(len(node_times), -1, dtype=np.int32)
+    for s in statistics:
+        s.start(node_times, samples, parent)
+
+    for left, right, outgoing, incoming in edge_diffs(tables):
+        for s in statistics:
+            s.process_outgoing(*outgoing)
+        parent[outgoing[1]] = -1
+        parent[incoming[1]] = incoming[0]
+        for s in statistics:
+            s.process_incoming(*incoming)
+        yield left, right, [s.get_result() for s in statistics]
@@ -0,0 +1,114 @@
+"""
+Check that the Numba and Python backends give the same
+results for the same seeds.
+
+Every function with a loop compiled by
+:func:`simbook.coalescent.backend.jit` is run in two
+subprocesses, one with ``SIMBOOK_BACKEND=python`` and one
+with the default backend, and the outputs are compared
+exactly.  The exit status is 1 if any output differs and
+2 if Numba is not installed, so that only one backend
+could be run.
+
+Usage:
+
+    PYTHONPATH=. python3 validation/backends.py
+"""
+import os
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+
+SEEDS = [1, 42, 12345]
+
+
+def _arrays(ts):
+    tables = ts.tables
+    return {"time": tables.nodes.time,
+            "population": tables.nodes.population,
+            "parent": tables.edges.parent,
+            "child": tables.edges.child}
+
+
+def _outputs():
+    """
+    Run every case, returning the backend in use
+    and the outputs, by case and seed.
+    """
+    import msprime
+    import simbook.coalescent.hudson1990 as hudson1990
+    import simbook.coalescent.migration as migration
+    from simbook.coalescent.backend import BACKEND
+    from simbook.coalescent.demography import SizeHistory
+    from simbook.treeseqs.statistics import (custom_quantities,
+                                             SampleCounts, SampleSetTMRCA)
+
+    def statistics(seed):
+        ts = msprime.simulate(30, recombination_rate=10., random_seed=seed)
+        stats = [SampleSetTMRCA([0, 5, 9, 20]), SampleCounts()]
+        return [(left, result[0], result[1].copy()) for left, right, result
+                in custom_quantities(ts, stats)]
+
+    cases = {
+        "hudson1990._swaps": lambda rng: _arrays(
+            hudson1990.simulate(100, rng=rng)),
+        "hudson1990._swaps[growth]": lambda rng: _arrays(
+            hudson1990.simulate(100, rng=rng,
+                                size_history=SizeHistory.exponential(1.))),
+        "migration._two_demes_events": lambda rng: _arrays(
+            migration.simulate_two_demes(40, 30, 0.5, rng=rng)),
+        "migration._tree_summaries": lambda rng:
+            migration.simulate_two_demes_summaries(6, 4, 1., 200, rng=rng),
+        "genealogy._add_subtree_sizes": lambda rng:
+            hudson1990.simulate(100, rng=rng,
+                                compact=True).subtree_sizes(),
+        "statistics._remove_edges/_insert_edges": lambda rng:
+            statistics(int(rng.integers(1, 2**31))),
+    }
+    results = {}
+    for name, case in cases.items():
+        results[name] = [case(np.random.default_rng(seed)) for seed in SEEDS]
+    return BACKEND, results
+
+
+def _run(backend):
+    env = dict(os.environ)
+    env.pop("SIMBOOK_BACKEND", None)
+    if backend is not None:
+        env["SIMBOOK_BACKEND"] = backend
+    out = subprocess.run([sys.executable, __file__, "--child"], env=env,
+                         stdout=subprocess.PIPE, check=True).stdout
+    return pickle.loads(out)
+
+
+def _equal(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    return np.array_equal(a, b, equal_nan=True)
+
+
+def main():
+    python_backend, python = _run("python")
+    default_backend, default = _run(None)
+    if default_backend != "numba":
+        print("Numba is not installed, so only the {} backend "
+              "was run".format(python_backend))
+        return 2
+    status = 0
+    for name in python:
+        same = _equal(python[name], default[name])
+        print("{} {}".format("SAME" if same else "DIFFERENT", name))
+        if not same:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        sys.stdout.buffer.write(pickle.dumps(_outputs()))
+    else:
+        sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Sequential validation of the simbook simulators against msprime.
+
+For each simulator, replicates of simbook and of an
+equivalent msprime model are simulated in batches, and
+the distributions of TMRCA, TTOT, and the branch-mode f2
+statistic are compared with two-sample Kolmogorov-Smirnov
+(KS) and Anderson-Darling (AD) tests after each batch.
+The number of replicates doubles at every look, and
+simulation stops as soon as a decision is reached:
+
+* FAIL, if any KS or AD test rejects equality.  The level
+  of the tests at look k is ``alpha/2**k``, split over
+  tests and statistics, so the chance of failing a correct
+  simulator is at most ``alpha``.
+
+* PASS, if for every statistic the KS distance between the
+  true distributions is shown to be less than ``delta``.
+  By the Dvoretzky-Kiefer-Wolfowitz inequality, each
+  empirical distribution is within ``sqrt(log(2/b)/(2n))`` of
+  the truth with probability 1 - b.  Using ``b = beta/2**k``,
+  split over statistics, the chance of passing a simulator
+  that is off by ``delta`` or more is at most ``beta``.
+
+If neither happens by ``--max-replicates``, the result is
+UNDECIDED.  The exit status is 1 if any simulator fails
+and 2 if any is undecided.
+
+Usage:
+
+    PYTHONPATH=. python3 validation/validate.py --delta 0.1
+"""
+import argparse
+import math
+import sys
+import time
+
+import msprime
+import numpy as np
+
+import simbook.coalescent.demes as demes
+import simbook.coalescent.hudson1990 as hudson1990
+import simbook.coalescent.migration as migration
+import simbook.coalescent.recombination as recombination
+from simbook.coalescent.demography import (SizeHistory, MassMigration,
+                                           MigrationRateChange,
+                                           DemeSizeChange)
+from simbook.coalescent.genealogy import Genealogy
+
+STATISTICS = ("tmrca", "ttot", "f2")
+NSAM = 10
+N0, N1 = 6, 4
+MIGRATE = 1.0
+GROWTH_RATE = 2.0
+RECOMBINATION_RATE = 1.0
+
+
+def _ts_statistics(replicates, a, b):
+    """
+    TMRCA, TTOT, and the f2 statistic between sample sets
+    a and b of each tree sequence, averaged along the genome.
+    """
+    out = {k: [] for k in STATISTICS}
+    for ts in replicates:
+        tmrca = 0.0
+        for tree in ts.trees():
+            tmrca += tree.span*max(tree.time(r) for r in tree.roots)
+        out["tmrca"].append(tmrca/ts.sequence_length)
+        out["ttot"].append(ts.segregating_sites(mode="branch"))
+        out["f2"].append(ts.f2([a, b], mode="branch"))
+    return {k: np.array(v) for k, v in out.items()}
+
+
+def _halves(n):
+    return list(range(n//2)), list(range(n//2, n))
+
+
+def _deme_samples():
+    return list(range(N0)), list(range(N0, N0 + N1))
+
+
+def _seed(rng):
+    return int(rng.integers(1, 2**31))
+
+
+def _msprime_single(nreps, rng, growth_rate=0.):
+    config = [msprime.PopulationConfiguration(
+        NSAM, initial_size=0.5, growth_rate=growth_rate)]
+    reps = msprime.simulate(population_configurations=config, Ne=0.5,
+                            num_replicates=nreps, random_seed=_seed(rng))
+    return _ts_statistics(reps, *_halves(NSAM))
+
+
+def _msprime_two_demes(nreps, rng):
+    config = [msprime.PopulationConfiguration(N0, initial_size=0.5),
+              msprime.PopulationConfiguration(N1, initial_size=0.5)]
+    reps = msprime.simulate(population_configurations=config, Ne=0.5,
+                            migration_matrix=[[0, MIGRATE], [MIGRATE, 0]],
+                            num_replicates=nreps, random_seed=_seed(rng))
+    return _ts_statistics(reps, *_deme_samples())
+
+
+# Three demes, with the third admixing into the second
+# and then the second merging into the first
+DEME_SAMPLES = [N0, N1, 3]
+DEME_SIZES = [1., 2., 0.5]
+DEME_MIGRATION = [[0, 0.5, 0], [0.5, 0, 0], [0, 0, 0]]
+
+
+def _demes_events():
+    return [DemeSizeChange(0.1, 1, 0.3),
+            MassMigration(0.3, 2, 1, 0.4),
+            MigrationRateChange(0.5, 2.0, (2, 0)),
+            MigrationRateChange(0.7, 0.1),
+            MassMigration(1.0, 1, 0),
+            DemeSizeChange(1.0, 0, 3.0)]
+
+
+def _msprime_demes(nreps, rng):
+    config = [msprime.PopulationConfiguration(n, initial_size=0.5*x)
+              for n, x in zip(DEME_SAMPLES, DEME_SIZES)]
+    events = [msprime.PopulationParametersChange(
+                  0.1, initial_size=0.15, population=1),
+              msprime.MassMigration(0.3, 2, 1, 0.4),
+              msprime.MigrationRateChange(0.5, 2.0, matrix_index=(2, 0)),
+              msprime.MigrationRateChange(0.7, 0.1),
+              msprime.MassMigration(1.0, 1, 0, 1.0),
+              msprime.PopulationParametersChange(
+                  1.0, initial_size=1.5, population=0)]
+    reps = msprime.simulate(population_configurations=config, Ne=0.5,
+                            migration_matrix=DEME_MIGRATION,
+                            demographic_events=events,
+                            num_replicates=nreps, random_seed=_seed(rng))
+    return _ts_statistics(reps, *_deme_samples())
+
+
+def _msprime_recombination(nreps, rng):
+    reps = msprime.simulate(NSAM, Ne=0.5,
+                            recombination_rate=RECOMBINATION_RATE,
+                            num_replicates=nreps, random_seed=_seed(rng))
+    return _ts_statistics(reps, *_halves(NSAM))
+
+
+def _hudson(nreps, rng):
+    reps = hudson1990.simulate(NSAM, rng=rng, num_replicates=nreps)
+    return _ts_statistics(reps, *_halves(NSAM))
+
+
+def _hudson_growth(nreps, rng):
+    history = SizeHistory.exponential(GROWTH_RATE)
+    reps = hudson1990.simulate(NSAM, rng=rng, num_replicates=nreps,
+                               size_history=history)
+    return _ts_statistics(reps, *_halves(NSAM))
+
+
+def _hudson_replicates(nreps, rng):
+    time, parent, child = hudson1990.simulate_replicates(NSAM, nreps,
+                                                         rng=rng)
+    reps = (Genealogy.from_edges(time[r], parent, child[r],
+                                 NSAM).tree_sequence()
+            for r in range(nreps))
+    return _ts_statistics(reps, *_halves(NSAM))
+
+
+def _hudson_summaries(nreps, rng):
+    tmrca, ttot = hudson1990.simulate_summaries(NSAM, nreps, rng=rng)
+    return {"tmrca": tmrca, "ttot": ttot}
+
+
+def _two_demes(nreps, rng):
+    reps = migration.simulate_two_demes(N0, N1, MIGRATE, rng=rng,
+                                        num_replicates=nreps)
+    return _ts_statistics(reps, *_deme_samples())
+
+
+def _two_demes_summaries(nreps, rng):
+    tmrca, ttot, f2 = migration.simulate_two_demes_summaries(
+        N0, N1, MIGRATE, nreps, rng=rng)
+    return {"tmrca": tmrca, "ttot": ttot, "f2": f2}
+
+
+def _demes(nreps, rng):
+    reps = demes.simulate_demes(DEME_SAMPLES, DEME_MIGRATION, rng=rng,
+                                    num_replicates=nreps, sizes=DEME_SIZES,
+                                    demographic_events=_demes_events())
+    return _ts_statistics(reps, *_deme_samples())
+
+
+def _recombination(nreps, rng):
+    reps = recombination.simulate(NSAM, RECOMBINATION_RATE, rng=rng,
+                                  num_replicates=nreps)
+    return _ts_statistics(reps, *_halves(NSAM))
+
+
+CASES = {
+    "hudson1990.simulate": (_hudson, _msprime_single),
+    "hudson1990.simulate[growth]": (
+        _hudson_growth,
+        lambda nreps, rng: _msprime_single(nreps, rng, GROWTH_RATE)),
+    "hudson1990.simulate_replicates": (_hudson_replicates, _msprime_single),
+    "hudson1990.simulate_summaries": (_hudson_summaries, _msprime_single),
+    "migration.simulate_two_demes": (_two_demes, _msprime_two_demes),
+    "migration.simulate_two_demes_summaries": (_two_demes_summaries,
+                                               _msprime_two_demes),
+    "demes.simulate_demes": (_demes, _msprime_demes),
+    "recombination.simulate": (_recombination, _msprime_recombination),
+}
+
+
+def _merge(a, b):
+    """
+    Merge new values into a sorted array.
+    """
+    b = np.sort(b)
+    return np.insert(a, np.searchsorted(a, b), b)
+
+
+def ks_distance(x, y):
+    """
+    The two-sample KS statistic of sorted arrays x and y.
+    """
+    z = np.concatenate((x, y))
+    fx = np.searchsorted(x, z, side="right")/len(x)
+    fy = np.searchsorted(y, z, side="right")/len(y)
+    return float(np.abs(fx - fy).max())
+
+
+def ks_pvalue(d, n, m):
+    """
+    The asymptotic p-value of a two-sample KS statistic.
+    """
+    x = d*math.sqrt(n*m/(n + m))
+    if x < 0.2:
+        return 1.0
+    k = np.arange(1, 101)
+    p = 2.*((-1.)**(k - 1)*np.exp(-2.*k**2*x**2)).sum()
+    return float(min(max(p, 0.), 1.))
+
+
+def ad_statistic(x, y):
+    """
+    The two-sample Anderson-Darling statistic of
+    sorted arrays x and y (Pettitt, 1976).
+    """
+    n = len(x)
+    m = len(y)
+    N = n + m
+    z = np.concatenate((x, y))
+    from_x = np.concatenate((np.ones(n), np.zeros(m)))
+    from_x = from_x[np.argsort(z, kind="stable")]
+    i = np.arange(1, N)
+    mi = np.cumsum(from_x)[:-1]
+    return float(((mi*N - n*i)**2/(i*(N - i))).sum()/(n*m))
+
+
+def ad_pvalue(a2):
+    """
+    The asymptotic p-value of an Anderson-Darling
+    statistic, using the approximation of Marsaglia and
+    Marsaglia (2004) to the limiting distribution.
+    """
+    z = a2
+    if z <= 0.:
+        return 1.0
+    if z < 2.:
+        cdf = math.exp(-1.2337141/z)/math.sqrt(z)*(
+            2.00012 + (.247105 - (.0649821 - (.0347962 - (
+                .011672 - .00168691*z)*z)*z)*z)*z)
+    else:
+        cdf = math.exp(-math.exp(1.0776 - (2.30695 - (.43424 - (
+            .082433 - (.008056 - .0003146*z)*z)*z)*z)*z))
+    return min(max(1. - cdf, 0.), 1.)
+
+
+def validate(simulator, reference, rng, alpha=0.01, beta=0.01, delta=0.1,
+             batch_size=250, max_replicates=20000):
+    """
+    Compare a simulator to a reference by the sequential
+    procedure described at the top of this file.
+
+    Both functions are called as ``func(nreps, rng)`` and
+    return arrays of statistics by name.  Statistics that the
+    simulator does not return are not compared.
+
+    :returns: The decision, the number of replicates of
+              each simulator, and the last KS distance and
+              p-values of each statistic.
+    :rtype: tuple
+    """
+    sims = None
+    refs = None
+    n = 0
+    look = 0
+    target = batch_size
+    while n < max_replicates:
+        look += 1
+        nreps = min(target, max_replicates) - n
+        new_sims = simulator(nreps, rng)
+        new_refs = reference(nreps, rng)
+        if sims is None:
+            sims = {k: np.sort(v) for k, v in new_sims.items()}
+            refs = {k: np.sort(new_refs[k]) for k in sims}
+        else:
+            for k in sims:
+                sims[k] = _merge(sims[k], new_sims[k])
+                refs[k] = _merge(refs[k], new_refs[k])
+        n += nreps
+        target *= 2
+
+        nstats = len(sims)
+        level = alpha/2**look/(2*nstats)
+        eps = math.sqrt(math.log(2./(beta/2**look/(2*nstats)))/(2*n))
+        results = {}
+        reject = False
+        accept = True
+        for k in sims:
+            d = ks_distance(sims[k], refs[k])
+            p_ks = ks_pvalue(d, n, n)
+            p_ad = ad_pvalue(ad_statistic(sims[k], refs[k]))
+            results[k] = {"ks": d, "ks_pvalue": p_ks, "ad_pvalue": p_ad}
+            reject |= p_ks < level or p_ad < level
+            accept &= d + 2*eps < delta
+        if reject:
+            return "FAIL", n, results
+        if accept:
+            return "PASS", n, results
+    return "UNDECIDED", n, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--alpha", type=float, default=0.01,
+                        help="Chance of failing a correct simulator")
+    parser.add_argument("--beta", type=float, default=0.01,
+                        help="Chance of passing a simulator whose "
+                             "distributions are off by delta")
+    parser.add_argument("--delta", type=float, default=0.1,
+                        help="The smallest KS distance to detect")
+    parser.add_argument("--batch-size", type=int, default=250,
+                        help="Number of replicates at the first look")
+    parser.add_argument("--max-replicates", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("cases", nargs="*",
+                        help="Simulators to check (default: all)")
+    args = parser.parse_args()
+
+    names = args.cases or list(CASES)
+    rng = np.random.default_rng(args.seed)
+    status = 0
+    for name in names:
+        simulator, reference = CASES[name]
+        start = time.perf_counter()
+        decision, n, results = validate(
+            simulator, reference, rng, args.alpha, args.beta, args.delta,
+            args.batch_size, args.max_replicates)
+        print("{} {}: {} replicates, {:.1f} s".format(
+            decision, name, n, time.perf_counter() - start))
+        for k, r in results.items():
+            print("    {}: KS {:.4f} (p = {:.3g}), AD p = {:.3g}".format(
+                k, r["ks"], r["ks_pvalue"], r["ad_pvalue"]))
+        if decision == "FAIL":
+            status = 1
+        elif decision == "UNDECIDED" and status == 0:
+            status = 2
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()